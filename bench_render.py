@@ -0,0 +1,587 @@
+# bench_render.py — offline render benchmarks: synthetic fixtures, no Pexels / YouTube needed
+import os, sys, re, csv, json, time, argparse, platform, resource, subprocess, tracemalloc, threading, random, shutil
+import multiprocessing as mp
+from pathlib import Path
+from datetime import timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+from PIL import Image
+
+import make_videos as mv
+
+BENCH_DIR = Path("bench")
+OVERLAY = "Spread = trading cost"
+
+def ffmpeg(*args):
+    subprocess.run([mv.ffmpeg_bin(), "-y", "-loglevel", "error", *args], check=True)
+
+# --- Fixtures ---
+def fixture_video(w, h, seconds, fps=30):
+    p = BENCH_DIR / f"src_{w}x{h}_{seconds}s.mp4"
+    if not p.exists():
+        ffmpeg("-f", "lavfi", "-i", f"testsrc2=s={w}x{h}:r={fps}:d={seconds}",
+               "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p", str(p))
+    return str(p)
+
+def fixture_grain(w, h, seconds, fps=30):
+    # testsrc2 plus temporal film grain: closer to stock footage for the encoder than the clean pattern
+    p = BENCH_DIR / f"grain_{w}x{h}_{seconds}s.mp4"
+    if not p.exists():
+        ffmpeg("-f", "lavfi", "-i", f"testsrc2=s={w}x{h}:r={fps}:d={seconds}", "-vf", "noise=alls=5:allf=t",
+               "-c:v", "libx264", "-preset", "ultrafast", "-crf", "10", "-pix_fmt", "yuv420p", str(p))
+    return str(p)
+
+def fixture_photos(n=6, w=1200, h=1800):
+    out = []
+    for i in range(n):
+        p = BENCH_DIR / f"photo_{i}_{w}x{h}.jpg"
+        if not p.exists():
+            yy, xx = np.mgrid[0:h, 0:w]
+            rgb = np.stack([(xx*255//w + 40*i) % 256, yy*255//h, ((xx+yy)//8 + 30*i) % 256], -1).astype(np.uint8)
+            Image.fromarray(rgb).save(p, quality=90)
+        out.append(str(p))
+    return out
+
+def fixture_music(seconds=60):
+    p = BENCH_DIR / f"music_{seconds}s.mp3"
+    if not p.exists():
+        ffmpeg("-f", "lavfi", "-i", f"sine=frequency=220:duration={seconds}", "-ac", "2", str(p))
+    return str(p)
+
+def fixture_media(kind):
+    if kind == "video": return [fixture_video(720, 1280, 10)]
+    if kind == "grain": return [fixture_grain(1080, 1920, 10)]
+    if kind == "hvideo": return [fixture_video(1920, 1080, 10)]
+    if kind == "photos": return fixture_photos()
+    return []
+
+# --- Checks ---
+def frame_diff(a, b):
+    # PSNR/SSIM of b against a, averaged over all frames
+    r = subprocess.run([mv.ffmpeg_bin(), "-i", a, "-i", b, "-lavfi", "[0:v][1:v]psnr;[0:v][1:v]ssim",
+                        "-f", "null", "-"], capture_output=True, text=True)
+    psnr = re.search(r"PSNR .*average:(\S+)", r.stderr); ssim = re.search(r"SSIM .*All:(\S+)", r.stderr)
+    return {"psnr": float(psnr.group(1)) if psnr else None, "ssim": float(ssim.group(1)) if ssim else None}
+
+# --- Benchmarks ---
+def cmd_engines(args):
+    # wall time and frame difference per template, MoviePy vs filtergraph (photos always take MoviePy)
+    music = mv.music_bed(fixture_music())
+    for kind in args.kinds:
+        if kind == "photos":
+            print("photos   skipped: the ffmpeg engine renders photo rows with MoviePy"); continue
+        paths = fixture_media(kind)
+        tmpl = "video" if kind == "hvideo" else kind
+        outs = {}
+        for engine in ("moviepy", "ffmpeg"):
+            out = BENCH_DIR / f"engines_{kind}_{engine}.mp4"
+            t0 = time.perf_counter()
+            mv.render_media(tmpl, paths, OVERLAY, music, out, args.threads, engine, args.encoder)
+            outs[engine] = (str(out), time.perf_counter() - t0)
+        (a, ta), (b, tb) = outs["moviepy"], outs["ffmpeg"]
+        d = frame_diff(a, b)
+        diff = f"PSNR {d['psnr']:.2f} dB  SSIM {d['ssim']:.4f}" if d["psnr"] else "frame diff n/a (geometry differs)"
+        print(f"{kind:8s} moviepy {ta:6.2f}s  ffmpeg {tb:6.2f}s  speedup x{ta/tb:4.1f}  {diff}")
+
+def legacy_text_img(text, w, h, font_size=64, fill=(255,255,255), bg=(11,31,59,200)):
+    # the pre-cache text bar: font loaded per call, quadratic wrap, PNG written to tmp/
+    from PIL import ImageDraw, ImageFont
+    img = Image.new("RGBA",(w,h),(0,0,0,0))
+    d = ImageDraw.Draw(img); d.rectangle([0,0,w,h], fill=bg)
+    try: font = ImageFont.truetype("DejaVuSans-Bold.ttf", font_size)
+    except OSError: font = ImageFont.load_default()
+    words, lines, line = text.split(), [], ""
+    for w1 in words:
+        test = (line + " " + w1).strip()
+        if d.textlength(test, font=font) > w-80:
+            if line: lines.append(line); line = w1
+        else: line = test
+    if line: lines.append(line)
+    y = int((h - len(lines)*font_size*1.1)/2)
+    for ln in lines:
+        tw = d.textlength(ln, font=font); x = int((w - tw)/2)
+        d.text((x,y), ln, font=font, fill=fill); y += int(font_size*1.1)
+    p = mv.tmp_file("t", ".png"); img.save(p); return str(p)
+
+def cmd_text(args):
+    # rows sharing --distinct overlay texts: legacy PNG round-trip vs memoized RGBA arrays
+    words = ("spread pips leverage margin pullback breakout liquidity session London Tokyo candle trend "
+             "support resistance risk reward stop loss").split()
+    rng = random.Random(0)
+    texts = [" ".join(rng.choices(words, k=args.words)) for _ in range(args.distinct)]
+    rows = [texts[i % len(texts)] for i in range(args.rows)]
+    t0 = time.perf_counter()
+    for t in rows:
+        p = legacy_text_img(t, mv.W, mv.BAR_H); np.asarray(Image.open(p).convert("RGBA")); os.unlink(p)
+    legacy = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for t in rows: mv.Overlay(t, 0.7)
+    cached = time.perf_counter() - t0
+    same = all(np.array_equal(np.asarray(Image.open(p).convert("RGBA")), mv.render_text_rgba(t, mv.W, mv.BAR_H))
+               for t in texts[:5] for p in [legacy_text_img(t, mv.W, mv.BAR_H)])
+    print(f"{args.rows} rows / {args.distinct} texts / {args.words} words: legacy {legacy/args.rows*1e3:7.2f} ms/row  "
+          f"cached {cached/args.rows*1e3:7.2f} ms/row  x{legacy/max(cached, 1e-9):5.1f}  pixels identical: {same}")
+    print("layout cache:", mv.layout_text.cache_info())
+
+def legacy_overlay(bg, text, opacity=0.7):
+    # the pre-flattening template: bar ColorClip + text ImageClip composited every frame
+    from moviepy.editor import ColorClip, ImageClip, CompositeVideoClip
+    T = mv.TARGET_DURATION
+    bar = ColorClip((mv.W, mv.BAR_H), color=(11,31,59)).set_duration(T).set_opacity(opacity).set_position(("center","top"))
+    txt = ImageClip(legacy_text_img(text, mv.W, mv.BAR_H)).set_duration(T).set_position(("center","top"))
+    return CompositeVideoClip([bg, bar, txt])
+
+def per_frame(clip, frames, spread=False):
+    # seconds and tracemalloc peak per get_frame over `frames` frames (from t=0, or spread over the clip)
+    ts = [i * clip.duration / frames if spread else i / mv.FPS for i in range(frames)]
+    clip.get_frame(0)  # warm-up: lazy buffers, PIL font load
+    tracemalloc.start(); peaks = []
+    t0 = time.perf_counter()
+    for t in ts:
+        tracemalloc.reset_peak(); base = tracemalloc.get_traced_memory()[0]
+        clip.get_frame(t)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    dt = time.perf_counter() - t0
+    tracemalloc.stop()
+    return dt / frames, sum(peaks) / frames
+
+def cmd_overlay(args):
+    # legacy bar+text composite vs the pre-flattened Overlay on the same background
+    from moviepy.editor import VideoClip
+    noise = np.random.default_rng(0).integers(0, 256, (mv.H, mv.W, 3), dtype=np.uint8)
+    bg = VideoClip(lambda t: noise, duration=mv.TARGET_DURATION)  # a "moving" source: no ImageClip shortcuts
+    old, new = legacy_overlay(bg, OVERLAY), bg.fl_image(mv.Overlay(OVERLAY, 0.7).apply)
+    err = np.abs(old.get_frame(0).astype(int) - new.get_frame(0).astype(int)).max()
+    frame_mb = mv.W * mv.H * 3 / 2**20
+    for name, clip in (("composite", old), ("flattened", new)):
+        sec, peak = per_frame(clip, args.frames)
+        print(f"{name:10s} {sec*1000:7.2f} ms/frame  peak alloc {peak/2**20:7.2f} MiB/frame "
+              f"(~{peak/2**20/frame_mb:.1f} full RGB frames)")
+    print(f"max pixel difference: {err}")
+
+def legacy_photos(paths):
+    # the pre-slideshow template: chained PIL resizes per ImageClip (aspect not kept), hard cuts
+    from moviepy.editor import ImageClip, concatenate_videoclips
+    per = max(5, int(mv.TARGET_DURATION/max(1,len(paths))))
+    clips = [ImageClip(p).resize(height=mv.H).resize(width=mv.W).set_duration(per) for p in paths]
+    return concatenate_videoclips(clips).subclip(0, min(mv.TARGET_DURATION, per*len(paths)))
+
+def cmd_slideshow(args):
+    # build time, per-frame cost and allocations: legacy photo clips vs KenBurnsClip
+    photos = fixture_photos(w=args.photo_w, h=args.photo_h)
+    frame_mb = mv.W * mv.H * 3 / 2**20
+    for name, make in (("legacy", lambda: legacy_photos(photos)),
+                       ("kenburns", lambda: mv.KenBurnsClip(photos, mv.TARGET_DURATION))):
+        t0 = time.perf_counter(); clip = make(); build = time.perf_counter() - t0
+        sec, peak = per_frame(clip, args.frames, spread=True)
+        print(f"{name:9s} build {build:6.2f}s  {sec*1000:7.2f} ms/frame  peak alloc {peak/2**20:7.2f} MiB/frame "
+              f"(~{peak/2**20/frame_mb:.1f} full RGB frames)")
+        if args.export:
+            out = BENCH_DIR / f"slideshow_{name}.mp4"
+            clip.write_videofile(str(out), fps=mv.FPS, codec="libx264", preset="ultrafast", threads=args.threads, logger=None)
+            print("  wrote", out)
+        clip.close()
+
+def legacy_video(path):
+    # the pre-streaming path: full-res VideoFileClip, crop + resize in Python, concatenated loops
+    import math
+    from moviepy.editor import VideoFileClip, concatenate_videoclips
+    from moviepy.video.fx.all import crop
+    clip = VideoFileClip(path); w, h = clip.w, clip.h
+    if abs(w/h - mv.W/mv.H) > 0.01:
+        new_w = int(h*mv.W/mv.H); x1 = max(0, (w-new_w)//2)
+        clip = crop(clip, x1=x1, y1=0, x2=x1+new_w, y2=h)
+    clip = clip.resize((mv.W, mv.H))
+    loops = math.ceil(mv.TARGET_DURATION/clip.duration)
+    return concatenate_videoclips([clip]*loops).subclip(0, mv.TARGET_DURATION)
+
+def rss_mb():
+    # peak RSS of this process and of its largest reaped child (ffmpeg), MB
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024)
+
+def cmd_decode_one(args):
+    # Runs in its own interpreter so peak RSS belongs to one decode path only
+    clip = legacy_video(args.src) if args.path == "legacy" else mv.ScaledVideoClip(args.src, mv.TARGET_DURATION)
+    t0, c0 = time.perf_counter(), time.process_time()
+    n = sum(1 for _ in clip.iter_frames(fps=mv.FPS))
+    wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+    clip.close()
+    py, ff = rss_mb()
+    ch = resource.getrusage(resource.RUSAGE_CHILDREN); ff_cpu = ch.ru_utime + ch.ru_stime
+    print(json.dumps({"path": args.path, "frames": n, "wall_s": wall, "cpu_s": cpu, "ffmpeg_cpu_s": ff_cpu,
+                      "rss_mb": py, "ffmpeg_rss_mb": ff}))
+
+def cmd_decode(args):
+    # 4K vertical source: peak RSS and decode time, legacy MoviePy path vs ScaledVideoReader
+    src = fixture_video(2160, 3840, args.src_seconds)
+    for path in ("legacy", "streaming"):
+        out = subprocess.run([sys.executable, __file__, "--duration", str(mv.TARGET_DURATION), "--fps", str(mv.FPS), "decode-one",
+                              "--path", path, "--src", src], capture_output=True, text=True, check=True)
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        print(f"{path:9s} {r['frames']} frames  wall {r['wall_s']:6.2f}s  cpu py {r['cpu_s']:6.2f}s "
+              f"ffmpeg {r['ffmpeg_cpu_s']:6.2f}s  "
+              f"peak RSS python {r['rss_mb']:7.1f} MB  ffmpeg {r['ffmpeg_rss_mb']:7.1f} MB")
+
+def legacy_music(track, out):
+    # the pre-bed audio path: whole-track AudioFileClip, per-sample volumex, trimmed at export
+    from moviepy.editor import AudioFileClip
+    from moviepy.audio.fx.all import volumex
+    a = AudioFileClip(track).fx(volumex, 0.18)
+    a.subclip(0, min(a.duration, mv.TARGET_DURATION)).write_audiofile(str(out), fps=mv.AUDIO_RATE, logger=None)
+    a.close()
+    return {"output_bytes": out.stat().st_size}
+
+def cmd_audio(args):
+    # long track -> TARGET_DURATION bed: whole-file decode vs windowed decode, cold and cached
+    track = fixture_music(args.track_seconds)
+    mv.CACHE_DIR = BENCH_DIR / "audio_cache"; shutil.rmtree(mv.CACHE_DIR, ignore_errors=True)
+    stages = [("legacy", lambda: legacy_music(track, BENCH_DIR / "legacy_bed.wav")),
+              ("bed_cold", lambda: {"output_bytes": mv.music_bed(track, seed="row").stat().st_size}),
+              ("bed_cached", lambda: {"output_bytes": mv.music_bed(track, seed="row").stat().st_size})]
+    for name, fn in stages:
+        r = run_stage(name, fn)
+        print(f"{name:10s} wall {r['wall_s']:6.2f}s  cpu {r['cpu_s']:6.2f}s  peak RSS python {r['peak_rss_mb']:7.1f} MB "
+              f"ffmpeg {r['ffmpeg_peak_rss_mb']:6.1f} MB  out {r.get('output_bytes', 0)/1e6:5.2f} MB"
+              + (f"  ERROR {r['error']}" if r["error"] else ""))
+
+def cmd_encoders(args):
+    # encoder profiles over a lossless render of the video template: encode fps vs size and SSIM
+    mv.ENCODER_PROFILES["lossless"] = {"preset": "ultrafast", "crf": 0, "maxrate": None, "bufsize": None,
+                                       "tune": None, "gop": 1, "audio": "128k"}
+    # the settings every render used before profiles: x264 defaults at preset medium
+    mv.ENCODER_PROFILES["legacy"] = {"preset": "medium", "crf": 23, "maxrate": None, "bufsize": None,
+                                     "tune": None, "gop": 250/mv.FPS, "audio": "128k"}
+    frames = round(mv.TARGET_DURATION * mv.FPS)
+    for kind in args.kinds:
+        ref = BENCH_DIR / f"enc_ref_{kind}_{mv.TARGET_DURATION:g}s.mp4"
+        if not ref.exists():
+            mv.render_media("video", fixture_media(kind), OVERLAY, None, ref, args.threads, "ffmpeg", "lossless")
+        for name in args.profiles:
+            out = BENCH_DIR / f"enc_{kind}_{name}.mp4"
+            video, _ = mv.encoder_args(name, args.threads)
+            t0 = time.perf_counter()
+            ffmpeg("-i", str(ref), "-map", "0:v", *video, str(out))
+            wall = time.perf_counter() - t0
+            d, size = frame_diff(str(ref), str(out)), out.stat().st_size
+            print(f"{kind:6s} {name:11s} {frames/wall:7.1f} fps  {size/1e6:7.2f} MB  "
+                  f"{size*8/mv.TARGET_DURATION/1e6:6.2f} Mbit/s  PSNR {d['psnr']:6.2f} dB  SSIM {d['ssim']:.4f}")
+
+def cmd_formats(args):
+    # every format from one decode vs one full pass per format
+    music = mv.music_bed(fixture_music())
+    for kind in args.kinds:
+        paths = fixture_media(kind)
+        tmpl = "video" if kind == "hvideo" else kind
+        sep, t0 = {}, time.perf_counter()
+        for fmt in args.formats:
+            sep[fmt] = BENCH_DIR / f"formats_{kind}_{fmt}_separate.mp4"
+            mv.render_formats(tmpl, paths, OVERLAY, music, {fmt: sep[fmt]}, args.threads, args.encoder)
+        t_sep = time.perf_counter() - t0
+        fan = {fmt: BENCH_DIR / f"formats_{kind}_{fmt}_fanout.mp4" for fmt in args.formats}
+        t0 = time.perf_counter()
+        stats = mv.render_formats(tmpl, paths, OVERLAY, music, fan, args.threads, args.encoder)
+        t_fan = time.perf_counter() - t0
+        print(f"{kind:8s} {len(fan)} formats  separate {t_sep:6.2f}s  fan-out {t_fan:6.2f}s  x{t_sep/t_fan:4.2f}  "
+              f"master {stats.get('master', 'n/a')}  composite {stats.get('composite_s', 0):.2f}s")
+        for fmt in args.formats:
+            d = frame_diff(str(sep[fmt]), str(fan[fmt]))
+            size = mv.ffmpeg_parse_infos(str(fan[fmt]))["video_size"]
+            print(f"{'':8s} {fmt:5s} {size[0]}x{size[1]}  {fan[fmt].stat().st_size/1e6:6.2f} MB  "
+                  f"vs separate: SSIM {d['ssim']:.4f}")
+
+def _probe_video(path):
+    # decoded frames, keyframe indices and audio seconds, via showinfo and the null muxer (no ffprobe)
+    r = subprocess.run([mv.ffmpeg_bin(), "-i", path, "-map", "0:v", "-vf", "showinfo", "-f", "null", "-"],
+                       capture_output=True, text=True, check=True)
+    frames = re.findall(r"Parsed_showinfo.*? n: *\d+ .*?iskey:(\d)", r.stderr)
+    a = subprocess.run([mv.ffmpeg_bin(), "-i", path, "-map", "0:a?", "-f", "null", "-"], capture_output=True, text=True)
+    t = re.findall(r"time=(\d+):(\d+):([\d.]+)", a.stderr)
+    audio = round(int(t[-1][0])*3600 + int(t[-1][1])*60 + float(t[-1][2]), 3) if t else None
+    return len(frames), [i for i, k in enumerate(frames) if k == "1"], audio
+
+def _ssim_frames(ref, out):
+    # per-frame SSIM (All) of out against ref
+    stats = BENCH_DIR / "ssim_frames.log"
+    subprocess.run([mv.ffmpeg_bin(), "-v", "error", "-i", ref, "-i", out, "-lavfi",
+                    f"[0:v][1:v]ssim=stats_file={stats}", "-f", "null", "-"], check=True)
+    return [float(re.search(r"All:(\S+)", ln).group(1)) for ln in stats.read_text().splitlines()]
+
+def cmd_segments(args):
+    # one pass vs N parallel GOP-aligned segments: frames, seam keyframes and SSIM, audio duration
+    music = mv.music_bed(fixture_music())
+    for kind in args.kinds:
+        paths = fixture_media(kind)
+        tmpl = "video" if kind == "hvideo" else kind
+        ref = BENCH_DIR / f"segments_{kind}_single.mp4"
+        t0 = time.perf_counter()
+        mv.render_media(tmpl, paths, OVERLAY, music, ref, args.threads, "moviepy", args.encoder)
+        t_ref = time.perf_counter() - t0
+        n_ref = _probe_video(str(ref))[0]
+        print(f"{kind:8s} single pass {t_ref:6.2f}s  {n_ref} frames")
+        for n in args.counts:
+            mv.RENDER_SEGMENTS = n
+            out = BENCH_DIR / f"segments_{kind}_{n}.mp4"
+            t0 = time.perf_counter()
+            stats = mv.render_media(tmpl, paths, OVERLAY, music, out, max(args.threads, n), "segments", args.encoder)
+            wall = time.perf_counter() - t0
+            frames, keys, audio = _probe_video(str(out))
+            seams = [a for a, _ in mv.segment_bounds(n, args.encoder)[1:]]
+            ssim = _ssim_frames(str(ref), str(out))
+            near = [ssim[i] for a in seams for i in (a-1, a) if 0 <= i < len(ssim)]
+            ok = frames == n_ref and all(a in keys for a in seams)
+            print(f"{'':8s} {n:2d} segments {wall:6.2f}s  x{t_ref/wall:4.2f}  frames {frames}"
+                  f"  seams at keyframes {all(a in keys for a in seams)}  SSIM mean {sum(ssim)/len(ssim):.4f}"
+                  f"  min {min(ssim):.4f}  at seams {min(near) if near else float('nan'):.4f}"
+                  f"  audio {audio}s  concat {stats.get('concat_s', 0):.2f}s  {'OK' if ok else 'MISMATCH'}")
+
+# --- Suite: every stage in a forked child so peak RSS and CPU belong to that stage alone ---
+def _stage_child(fn, conn):
+    t0, c0 = time.perf_counter(), time.process_time()
+    try: extra, err = fn() or {}, None
+    except Exception as e: extra, err = {}, repr(e)
+    wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+    py, ff = rss_mb()
+    ch = resource.getrusage(resource.RUSAGE_CHILDREN)
+    conn.send({"wall_s": round(wall, 3), "cpu_s": round(cpu + ch.ru_utime + ch.ru_stime, 3),
+               "peak_rss_mb": round(py, 1), "ffmpeg_peak_rss_mb": round(ff, 1), "error": err, **extra})
+
+def run_stage(name, fn):
+    parent, child = mp.get_context("fork").Pipe(duplex=False)
+    p = mp.get_context("fork").Process(target=_stage_child, args=(fn, child)); p.start()
+    res = parent.recv() if parent.poll(24*3600) else {"error": "no result"}
+    p.join()
+    return {"stage": name, **res}
+
+def _frames(clip):
+    try: return {"frames": sum(1 for _ in clip.iter_frames(fps=mv.FPS))}
+    finally: clip.close()
+
+def _export(kind, paths, music, engine, threads, encoder):
+    out = BENCH_DIR / f"suite_{kind}_{engine}.mp4"
+    mv.render_media(kind, paths, OVERLAY, music, out, threads, engine, encoder)
+    return {"output_bytes": out.stat().st_size}
+
+def suite_stages(args):
+    music = mv.music_bed(fixture_music())
+    media = {"video": fixture_media("video"), "hvideo": fixture_media("hvideo"),
+             "photos": fixture_media("photos"), "fallback": []}
+    tmpl = lambda k: "video" if k == "hvideo" else k
+    yield "render_text_rgba", lambda: {"output_bytes": mv.render_text_rgba(OVERLAY, mv.W, mv.BAR_H).nbytes}
+    for k in args.kinds:
+        yield f"build_{k}", lambda k=k: _frames(mv.build_clip(tmpl(k), media[k], OVERLAY))
+        yield f"export_{k}_{args.engine}", lambda k=k: _export(tmpl(k), media[k], music, args.engine, args.threads, args.encoder)
+
+def cmd_suite(args):
+    # every render stage on synthetic fixtures -> JSON report, optionally diffed against a baseline
+    report = {"meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "git": _git_rev(), "python": platform.python_version(),
+                       "cpus": os.cpu_count(), "duration_s": mv.TARGET_DURATION, "fps": mv.FPS,
+                       "engine": args.engine, "encoder": args.encoder, "threads": args.threads},
+              "stages": []}
+    base = {}
+    if args.baseline and Path(args.baseline).exists():
+        base = {st["stage"]: st for st in json.loads(Path(args.baseline).read_text())["stages"]}
+    for name, fn in suite_stages(args):
+        res = run_stage(name, fn); report["stages"].append(res)
+        delta = ""
+        if name in base and base[name].get("wall_s"):
+            delta = f"  ({(res['wall_s']/base[name]['wall_s'] - 1)*100:+.0f}% vs baseline)"
+        err = f"  ERROR {res['error']}" if res.get("error") else ""
+        print(f"{name:22s} wall {res.get('wall_s', 0):7.2f}s  cpu {res.get('cpu_s', 0):7.2f}s  "
+              f"rss {res.get('peak_rss_mb', 0):7.1f} MB  out {res.get('output_bytes', 0)/1e6:6.2f} MB{delta}{err}")
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print("Report:", args.out)
+
+# --- Upload: local stand-in for the OAuth token + resumable upload endpoints ---
+class FakeYouTube(BaseHTTPRequestHandler):
+    # just enough of the resumable protocol: sessions, 308 + Range, `bytes */N` queries, random 503s
+    sessions, lock, fault_rate, counter = {}, threading.Lock(), 0.0, iter(range(1, 10**9))
+
+    def log_message(self, *a): pass
+
+    def _reply(self, code, body=None, headers=()):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(code)
+        for k, v in headers: self.send_header(k, v)
+        self.send_header("Content-Type", "application/json"); self.send_header("Content-Length", str(len(data)))
+        self.end_headers(); self.wfile.write(data)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_POST(self):
+        self._body()
+        if self.path.startswith("/token"):
+            return self._reply(200, {"access_token": "bench", "expires_in": 3600, "token_type": "Bearer"})
+        with self.lock: sid = str(next(self.counter)); self.sessions[sid] = 0
+        host = self.headers["Host"]
+        self._reply(200, {}, [("Location", f"http://{host}/session/{sid}")])
+
+    def do_PUT(self):
+        sid, data = self.path.rsplit("/", 1)[-1], self._body()
+        rng = self.headers.get("Content-Range", "")
+        if random.random() < self.fault_rate:
+            return self._reply(503, {"error": {"code": 503, "message": "backendError"}})
+        m = re.match(r"bytes (\d+)-(\d+)/(\d+|\*)", rng)
+        with self.lock:
+            if m and int(m.group(1)) == self.sessions[sid]: self.sessions[sid] += len(data)
+            got, total = self.sessions[sid], (m.group(3) if m else rng.rsplit("/", 1)[-1])
+        if total != "*" and got >= int(total):
+            return self._reply(200, {"id": f"bench{sid}", "status": {"uploadStatus": "uploaded"}})
+        self._reply(308, None, [("Range", f"bytes=0-{got-1}")] if got else [])
+
+def cmd_upload(args):
+    # synthetic MP4-sized files through UploadManager against FakeYouTube: throughput
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), FakeYouTube)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    root = f"http://127.0.0.1:{srv.server_address[1]}/"
+    mv.YT_API_ROOT, mv.YT_TOKEN_URI = root, root + "token"
+    mv.YT_CLIENT_ID, mv.YT_CLIENT_SECRET, mv.YT_REFRESH_TOKEN = "bench", "bench", "bench"
+    FakeYouTube.fault_rate = args.fault_rate
+    src = BENCH_DIR / f"upload_{args.size_mb}mb.bin"
+    if not src.exists() or src.stat().st_size != args.size_mb * 2**20:
+        src.write_bytes(os.urandom(args.size_mb * 2**20))
+    publish_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 86400))
+    for chunk in args.chunk_mb:
+        for workers in args.workers:
+            up = mv.UploadManager(workers=workers, chunk_mb=chunk, quota=10**9, quota_file=BENCH_DIR / "yt_quota.json")
+            t0 = time.perf_counter()
+            futs = [up.submit(up.upload, str(src), f"bench {i}", "", publish_at) for i in range(args.files)]
+            stats = [f.result()[1] for f in futs]; up.close()
+            wall = time.perf_counter() - t0
+            print(f"chunk {chunk:5.2f} MB  workers {workers}  {args.files} x {args.size_mb} MB in {wall:6.2f}s  "
+                  f"{args.files*args.size_mb*2**20/1e6/wall:7.1f} MB/s total  "
+                  f"{sum(s['mb_per_s'] for s in stats)/len(stats):7.1f} MB/s per upload  "
+                  f"retries {sum(s['retries'] for s in stats)}")
+    srv.shutdown()
+
+# --- Startup: hourly cold process vs the resident serve mode ---
+def _schedule(path, tag, n, minutes_ahead):
+    # prompts.csv with n rows from minutes_ahead on (negative: already past), titled by tag
+    base = mv.now_pt() + timedelta(minutes=minutes_ahead)
+    fields = ["PublishTime_Pacific", "Title", "Prompt_or_Script", "Broll_Keywords", "OverlayText", "CTA", "Hashtags"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fields); w.writeheader()
+        for i in range(n):
+            w.writerow({"PublishTime_Pacific": (base + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M"),
+                        "Title": f"Startup {tag} {i}", "Prompt_or_Script": "Bench row.", "Broll_Keywords": "charts",
+                        "OverlayText": f"{OVERLAY} ({tag} {i})", "CTA": "", "Hashtags": "#bench"})
+
+def cmd_startup(args):
+    # to idle and to one video: a cold process per check vs a warm Server.wake() (offline, fallback only)
+    work = (BENCH_DIR / "startup").resolve()
+    shutil.rmtree(work, ignore_errors=True); (work / "music").mkdir(parents=True)
+    shutil.copy(fixture_music(), work / "music")
+    blank = {k: "" for k in ("PEXELS_API_KEY", "YT_CLIENT_ID", "YT_CLIENT_SECRET", "YT_REFRESH_TOKEN")}
+    env = {**os.environ, **blank, "PYTHONPATH": str(Path(mv.__file__).resolve().parent)}
+    code = f"import make_videos as mv; mv.TARGET_DURATION = {mv.TARGET_DURATION}; mv.main()"
+
+    def cold(tag, n, ahead):
+        _schedule(work / "prompts.csv", tag, n, ahead)
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=work, env=env, check=True, capture_output=True)
+        return time.perf_counter() - t0
+
+    def warm(server, tag, n, ahead):
+        _schedule(work / "prompts.csv", tag, n, ahead)
+        t0 = time.perf_counter(); server.wake(); return time.perf_counter() - t0
+
+    idle = [cold(f"idle{i}", 10, -60) for i in range(args.repeat)]
+    one = [cold(f"cold{i}", 1, 30) for i in range(args.repeat)]
+    here = os.getcwd(); os.chdir(work)
+    try:
+        for k, v in blank.items(): setattr(mv, k, v)
+        _schedule(work / "prompts.csv", "boot", 10, -60)
+        t0 = time.perf_counter(); server = mv.Server(lead_min=60); boot = time.perf_counter() - t0
+        try:
+            w_idle = [warm(server, f"idle{i}", 10, -60) for i in range(args.repeat)]
+            w_one = [warm(server, f"warm{i}", 1, 30) for i in range(args.repeat)]
+        finally:
+            server.close()
+    finally:
+        os.chdir(here)
+    med = lambda xs: sorted(xs)[len(xs)//2]
+    print(f"imports (this process): {mv.IMPORT_S:.2f}s   serve warm-up after imports: {boot:.2f}s")
+    print(f"nothing due   cold process {med(idle):6.2f}s   warm wake {med(w_idle)*1000:8.1f} ms")
+    print(f"one video     cold process {med(one):6.2f}s   warm wake {med(w_one):8.2f} s   "
+          f"saved {med(one) - med(w_one):.2f}s per wake")
+
+def _git_rev():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError: return ""
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__ or "Offline render benchmarks.")
+    ap.add_argument("--duration", type=float, default=8, help="seconds rendered per video (TARGET_DURATION)")
+    ap.add_argument("--fps", type=int, default=mv.FPS)
+    ap.add_argument("--threads", type=int, default=mv.RENDER_THREADS, help="0 = all usable cores")
+    ap.add_argument("--encoder", choices=sorted(mv.ENCODER_PROFILES), default=mv.ENCODER_PROFILE)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("engines", help="MoviePy vs ffmpeg filtergraph: wall clock + frame diff")
+    p.add_argument("--kinds", nargs="+", default=["video", "hvideo", "fallback"],
+                   choices=["video", "hvideo", "photos", "fallback"])
+    p.set_defaults(func=cmd_engines)
+    p = sub.add_parser("overlay", help="per-frame time and allocations: composited vs pre-flattened overlay")
+    p.add_argument("--frames", type=int, default=60)
+    p.set_defaults(func=cmd_overlay)
+    p = sub.add_parser("text", help="text bar: legacy per-row PNG vs memoized fonts/layout/RGBA")
+    p.add_argument("--rows", type=int, default=200)
+    p.add_argument("--distinct", type=int, default=10)
+    p.add_argument("--words", type=int, default=12)
+    p.set_defaults(func=cmd_text)
+    p = sub.add_parser("slideshow", help="photo template: legacy resized ImageClips vs Ken Burns buffers")
+    p.add_argument("--frames", type=int, default=60, help="frames sampled evenly over the clip")
+    p.add_argument("--photo-w", type=int, default=3000)
+    p.add_argument("--photo-h", type=int, default=4000)
+    p.add_argument("--export", action="store_true", help="also write bench/slideshow_*.mp4 to eyeball")
+    p.set_defaults(func=cmd_slideshow)
+    p = sub.add_parser("decode", help="4K source: peak RSS + decode time, legacy vs streaming reader")
+    p.add_argument("--src-seconds", type=int, default=3, help="source length; shorter than --duration forces loops")
+    p.set_defaults(func=cmd_decode)
+    p = sub.add_parser("audio", help="music bed: whole-track decode vs windowed decode + cached WAV beds")
+    p.add_argument("--track-seconds", type=int, default=600)
+    p.set_defaults(func=cmd_audio)
+    p = sub.add_parser("encoders", help="encoder profiles: encode fps vs file size and SSIM")
+    p.add_argument("--kinds", nargs="+", default=["video", "grain"], choices=["video", "grain"])
+    p.add_argument("--profiles", nargs="+", default=["legacy", *mv.ENCODER_PROFILES], choices=["legacy", *mv.ENCODER_PROFILES])
+    p.set_defaults(func=cmd_encoders)
+    p = sub.add_parser("formats", help="multi-format: one decode fanned out to per-format encoders vs a pass per format")
+    p.add_argument("--kinds", nargs="+", default=["video", "hvideo", "photos", "fallback"],
+                   choices=["video", "hvideo", "photos", "fallback"])
+    p.add_argument("--formats", nargs="+", default=list(mv.FORMATS), choices=list(mv.FORMATS))
+    p.set_defaults(func=cmd_formats)
+    p = sub.add_parser("segments", help="one video: single pass vs GOP-aligned parallel segments + concat, seam check")
+    p.add_argument("--kinds", nargs="+", default=["video", "photos"], choices=["video", "hvideo", "photos"])
+    p.add_argument("--counts", type=int, nargs="+", default=[2, 4])
+    p.set_defaults(func=cmd_segments)
+    p = sub.add_parser("suite", help="time every render stage, write a machine-readable JSON report")
+    p.add_argument("--kinds", nargs="+", default=["video", "hvideo", "photos", "fallback"],
+                   choices=["video", "hvideo", "photos", "fallback"])
+    p.add_argument("--engine", choices=["moviepy", "ffmpeg", "segments"], default=mv.RENDER_ENGINE)
+    p.add_argument("--out", default=str(BENCH_DIR / "report.json"))
+    p.add_argument("--baseline", help="previous report.json to diff wall time against")
+    p.set_defaults(func=cmd_suite)
+    p = sub.add_parser("upload", help="resumable upload throughput vs chunk size / concurrency, local stand-in")
+    p.add_argument("--size-mb", type=int, default=24)
+    p.add_argument("--files", type=int, default=4)
+    p.add_argument("--chunk-mb", type=float, nargs="+", default=[1, 8, 32])
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    p.add_argument("--fault-rate", type=float, default=0.0, help="share of chunk PUTs answered with 503")
+    p.set_defaults(func=cmd_upload)
+    p = sub.add_parser("startup", help="cold process per cron tick vs a warm serve wake: idle and one-video latency")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=cmd_startup)
+    p = sub.add_parser("decode-one")
+    p.add_argument("--path", choices=["legacy", "streaming"], required=True)
+    p.add_argument("--src", required=True)
+    p.set_defaults(func=cmd_decode_one)
+    args = ap.parse_args(argv)
+
+    BENCH_DIR.mkdir(exist_ok=True); mv.ensure_dirs()
+    mv.TARGET_DURATION, mv.FPS = args.duration, args.fps
+    args.threads = args.threads or mv.auto_threads()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,133 @@
 # make_videos.py — NEXT-10, hardened, with guaranteed fallback render
-import os, csv, json, random, math, time, subprocess, traceback
+import os, csv, json, random, time, subprocess, traceback, argparse, hashlib, shutil, queue, threading, itertools
+import resource, cProfile, sqlite3, functools, wave, math, signal
+import multiprocessing as mp
+STARTED = time.perf_counter()  # import cost is reported by serve and bench_render.py startup
 from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future, wait
 from datetime import datetime, timedelta
 import pytz, requests
+import numpy as np
 
 from PIL import Image, ImageDraw, ImageFont
-from moviepy.editor import (VideoFileClip, ImageClip, AudioFileClip,
-                            CompositeVideoClip, concatenate_videoclips, ColorClip)
-from moviepy.video.fx.all import crop
-from moviepy.audio.fx.all import volumex
+if not hasattr(Image, "ANTIALIAS"): Image.ANTIALIAS = Image.LANCZOS  # moviepy 1.0.3 resize vs Pillow>=10
+from moviepy.editor import VideoClip, ImageClip, AudioFileClip, CompositeVideoClip
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
 
+import httplib2
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.http import MediaFileUpload
 from googleapiclient.errors import HttpError
 from google.auth.exceptions import RefreshError
+IMPORT_S = time.perf_counter() - STARTED
 
 CSV_PATH   = Path("prompts.csv")
 MUSIC_DIR  = Path("music")
 OUT_DIR    = Path("renders")
+POSTED_DIR = OUT_DIR / "posted"  # uploaded renders: kept for this run's artifact, not for reuse
 TMP_DIR    = Path("tmp")
 STATE_FILE = Path("posted_state.json")
+CACHE_DIR  = Path(os.getenv("CACHE_DIR", ".cache"))
+SCHEDULE_DB = Path(os.getenv("SCHEDULE_DB", str(CACHE_DIR / "schedule.db")))
+STATE_JOURNAL = Path(os.getenv("STATE_JOURNAL", str(CACHE_DIR / "posted.journal")))
+RENDER_MANIFEST = Path(os.getenv("RENDER_MANIFEST", str(CACHE_DIR / "renders.db")))
 
 W, H = 1080, 1920
+BAR_H = 200
+# Output geometries; 9x16 is the Short that gets uploaded, the others are cut from the same decoded frames
+FORMATS = {"9x16": (W, H), "1x1": (1080, 1080), "16x9": (1920, 1080)}
+RENDER_FORMATS = [f for f in os.getenv("RENDER_FORMATS", "9x16").split(",") if f]
+# Multi-format video: each frame decoded once at a master size capped at MASTER_MAX_MP megapixels
+MASTER_MAX_MP  = float(os.getenv("MASTER_MAX_MP", "4"))
 TARGET_DURATION = 32
+FPS = 30
+BATCH_SIZE = 10
+
+# Render pool: rows fan out over RENDER_WORKERS processes, each giving ffmpeg RENDER_THREADS threads
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "1"))
+RENDER_THREADS = int(os.getenv("RENDER_THREADS", "0"))  # 0: usable cores / RENDER_WORKERS
+# Encoder: a named x264/AAC profile (see ENCODER_PROFILES); bench_render.py encoders compares them
+ENCODER_PROFILE = os.getenv("ENCODER_PROFILE", "upload")
+# Render reuse: finished MP4s are recorded by input hash and reused; PRERENDER_DAYS renders ahead of the batch
+PRERENDER_DAYS    = float(os.getenv("PRERENDER_DAYS", "0"))
+RENDER_KEEP_DAYS  = float(os.getenv("RENDER_KEEP_DAYS", "14"))
+# Disk: tmp/ + renders/ are held under DISK_QUOTA_MB (0 = unbounded), oldest files evicted first
+DISK_QUOTA_MB = float(os.getenv("DISK_QUOTA_MB", "4096"))
+# Pipeline: rows fetched ahead of the renderer (bounded), photos downloaded PHOTO_FETCH_THREADS at a time
+PREFETCH_DEPTH      = int(os.getenv("PREFETCH_DEPTH", "2"))
+PHOTO_FETCH_THREADS = int(os.getenv("PHOTO_FETCH_THREADS", "6"))
+# State: postings hit the local journal at once; git commit+push every N postings / N seconds / end of run
+JOURNAL_FLUSH_EVERY = int(os.getenv("JOURNAL_FLUSH_EVERY", "10"))
+JOURNAL_FLUSH_SECS  = float(os.getenv("JOURNAL_FLUSH_SECS", "1800"))
+# Metrics: one JSON line per row+stage span, rotated per UTC day (metrics-YYYY-MM-DD.jsonl); RENDER_PROFILE=cprofile|pyinstrument profiles each render
+METRICS_FILE   = Path(os.getenv("METRICS_FILE", str(OUT_DIR / "metrics.jsonl")))
+RUN_ID         = os.getenv("GITHUB_RUN_ID") or f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+RENDER_PROFILE = os.getenv("RENDER_PROFILE", "")
+# "moviepy" composites frames in Python; "ffmpeg" runs the same template as one -filter_complex (video and
+# fallback only: photo rows need Ken Burns + crossfades and stay on MoviePy);
+# "segments" renders GOP-aligned time slices of the MoviePy template in parallel processes and joins them
+RENDER_ENGINE  = os.getenv("RENDER_ENGINE", "moviepy")
+RENDER_SEGMENTS = int(os.getenv("RENDER_SEGMENTS", "0"))  # segments engine: 0 = one per ffmpeg thread
+
+# Photo slideshow: each photo pans or zooms across a buffer KB_ZOOM x the frame; KB_XFADE s crossfades
+KB_ZOOM  = float(os.getenv("KB_ZOOM", "1.12"))
+KB_XFADE = float(os.getenv("KB_XFADE", "0.6"))
+
+# Pexels cache: API responses live CACHE_TTL_HOURS, everything is LRU-evicted above CACHE_MAX_MB
+CACHE_TTL_HOURS = float(os.getenv("CACHE_TTL_HOURS", "168"))
+CACHE_MAX_MB    = float(os.getenv("CACHE_MAX_MB", "2048"))
+# Pexels video search: up to PEXELS_MAX_PAGES pages of PEXELS_PER_PAGE, stopping once a rendition scores
+# <= PEXELS_GOOD_SCORE (see score_rendition); renditions over PEXELS_MAX_MB are never picked
+PEXELS_PER_PAGE   = int(os.getenv("PEXELS_PER_PAGE", "15"))
+PEXELS_MAX_PAGES  = int(os.getenv("PEXELS_MAX_PAGES", "3"))
+PEXELS_GOOD_SCORE = float(os.getenv("PEXELS_GOOD_SCORE", "0.6"))
+PEXELS_MAX_MB     = float(os.getenv("PEXELS_MAX_MB", "80"))
+# Music: a TARGET_DURATION window of the track, starting on a MUSIC_STEP_S grid, normalized, gained, faded
+MUSIC_GAIN     = float(os.getenv("MUSIC_GAIN", "0.18"))
+MUSIC_STEP_S   = float(os.getenv("MUSIC_STEP_S", "4"))  # ~2 bars at 120 bpm; also bounds beds per track
+MUSIC_FADE_IN  = float(os.getenv("MUSIC_FADE_IN", "0.5"))
+MUSIC_FADE_OUT = float(os.getenv("MUSIC_FADE_OUT", "1.5"))
 
 PEXELS_API_KEY   = os.getenv("PEXELS_API_KEY", "")
 YT_CLIENT_ID     = os.getenv("YT_CLIENT_ID", "")
 YT_CLIENT_SECRET = os.getenv("YT_CLIENT_SECRET", "")
 YT_REFRESH_TOKEN = os.getenv("YT_REFRESH_TOKEN", "")
+YT_TOKEN_URI     = os.getenv("YT_TOKEN_URI", "https://oauth2.googleapis.com/token")
+YT_API_ROOT      = os.getenv("YT_API_ROOT", "")  # e.g. http://127.0.0.1:8080/ to point at a local stand-in
+
+# Uploads: resumable chunks of YT_CHUNK_MB (rounded to 256 KiB), YT_UPLOAD_WORKERS at once, backoff on 5xx/drops;
+# no new upload starts once the Pacific day's YT_QUOTA_UNITS (videos.insert costs 1600) would be exceeded; units
+# spent are kept in YT_QUOTA_FILE, so hourly runs and serve share one daily budget as YouTube counts it
+YT_CHUNK_MB       = float(os.getenv("YT_CHUNK_MB", "8"))
+YT_UPLOAD_WORKERS = int(os.getenv("YT_UPLOAD_WORKERS", "2"))
+YT_MAX_RETRIES    = int(os.getenv("YT_MAX_RETRIES", "8"))
+YT_QUOTA_UNITS    = int(os.getenv("YT_QUOTA_UNITS", "10000"))
+YT_QUOTA_FILE     = Path(os.getenv("YT_QUOTA_FILE", str(CACHE_DIR / "yt_quota.json")))
+
+# Serve mode: wake SERVE_LEAD_MIN before the next unposted PublishTime; re-read the CSV at least every
+# SERVE_MAX_SLEEP_MIN; a row that failed is retried after SERVE_RETRY_MIN
+SERVE_LEAD_MIN      = float(os.getenv("SERVE_LEAD_MIN", "90"))
+SERVE_MAX_SLEEP_MIN = float(os.getenv("SERVE_MAX_SLEEP_MIN", "30"))
+SERVE_RETRY_MIN     = float(os.getenv("SERVE_RETRY_MIN", "60"))
 
 def ensure_dirs():
     OUT_DIR.mkdir(exist_ok=True); TMP_DIR.mkdir(exist_ok=True)
+    for sub in ("api", "media", "audio"): (CACHE_DIR / sub).mkdir(parents=True, exist_ok=True)
+
+_seq = itertools.count()
+def tmp_file(prefix, suffix):
+    # inside a Workspace scope the file lands in that row's scratch dir (see Workspace)
+    base = getattr(_ctx, "tmp", None) or TMP_DIR
+    return base / f"{prefix}_{os.getpid()}_{next(_seq)}_{int(time.time()*1000)}{suffix}"
+
+def part_file(p):
+    # temp name beside p for an atomic _publish; unique per call so threads writing the same p never share one
+    return p.with_name(f"{p.name}.{os.getpid()}.{next(_seq)}.part")
 
 def tz_pt(): return pytz.timezone("America/Los_Angeles")
 def now_pt(): return datetime.now(tz_pt())
@@ -42,46 +138,513 @@ def load_state():
     return json.loads(STATE_FILE.read_text()) if STATE_FILE.exists() else {"posted": []}
 
 def save_and_commit_state(state, msg):
+    # True once the push landed
     STATE_FILE.write_text(json.dumps(state, indent=2))
     try:
         subprocess.run(["git","config","user.email","bot@github.actions"],check=True)
         subprocess.run(["git","config","user.name","gh-actions-bot"],check=True)
         subprocess.run(["git","add",str(STATE_FILE)],check=True)
         subprocess.run(["git","commit","-m",msg],check=True)
-        subprocess.run(["git","push"],check=True)
+        for _ in range(3):
+            if subprocess.run(["git","push"]).returncode == 0: return True
+            # lost a race with another run: the file is rewritten whole, so merge the posted lists instead of
+            # rebasing, and commit the union on top of theirs
+            subprocess.run(["git","fetch"],check=True)
+            theirs = json.loads(subprocess.run(["git","show",f"@{{u}}:{STATE_FILE.as_posix()}"], check=True,
+                                               capture_output=True, text=True).stdout)
+            known = set(state["posted"])
+            state["posted"] += [k for k in theirs.get("posted", []) if k not in known]
+            subprocess.run(["git","reset","--keep","@{u}"],check=True)  # our state commit is superseded
+            STATE_FILE.write_text(json.dumps(state, indent=2))
+            subprocess.run(["git","add",str(STATE_FILE)],check=True)
+            if subprocess.run(["git","diff","--cached","--quiet"]).returncode == 0: return True  # theirs had it all
+            subprocess.run(["git","commit","-m",msg],check=True)
+        return False
     except Exception as e:
         print("State commit skipped:", e)
+        return False
 
-def pick_music():
-    if not MUSIC_DIR.exists(): return None
-    tr = [p for p in MUSIC_DIR.iterdir() if p.suffix.lower() in {".mp3",".wav",".m4a"}]
-    return random.choice(tr) if tr else None
+# Append-only fsync'd log of postings in front of posted_state.json; replayed after a crash, pushed in batches.
+# An upload's session URI is logged as soon as YouTube issues it, so a crashed upload can be resumed or confirmed
+class StateJournal:
+    def __init__(self, state, path=STATE_JOURNAL):
+        self.state, self.path, self.lock = state, Path(path), threading.Lock()
+        self.pending, self.since = [], time.monotonic()
+        self.open = {}  # key -> start entry of an upload with no outcome yet
+        self.replay()
+
+    def _append(self, entry):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n"); f.flush(); os.fsync(f.fileno())
+
+    def _compact(self):
+        # pushed postings leave the journal; start lines of uploads still running (other threads) must stay
+        if not self.open: self.path.unlink(missing_ok=True); return
+        tmp = part_file(self.path)
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in self.open.values())
+            f.flush(); os.fsync(f.fileno())
+        _publish(tmp, self.path)
+
+    def replay(self):
+        if not self.path.exists(): return
+        last = {}
+        for ln in self.path.read_text(encoding="utf-8").splitlines():
+            try: e = json.loads(ln)
+            except ValueError: continue  # torn last line from a crash mid-write
+            prev = last.get(e["key"], {})
+            if e.get("event") == "session":
+                if prev.get("event") == "start": last[e["key"]] = {**prev, "uri": e["uri"]}
+            elif e.get("event") == "posted" or prev.get("event") != "posted": last[e["key"]] = e
+        posted = []
+        for key, e in last.items():
+            if e["event"] == "start" and e.get("uri"):
+                print("Upload interrupted in an earlier run; its YouTube session is checked before the row is retried:", key)
+                self.open[key] = e
+            elif e["event"] == "start":
+                # no session URI: the crash came before YouTube answered the first chunk, which may have been all of it
+                print("WARNING: upload interrupted in an earlier run, marking posted; verify in YouTube Studio:", key)
+                e = {**e, "event": "posted", "video_id": None}
+            if e["event"] == "posted": posted.append(e)
+        known = set(self.state["posted"])
+        self.pending = [e for e in posted if e["key"] not in known]
+        self.state["posted"] += [e["key"] for e in self.pending]
+        print(f"Journal replay: {len(posted)} posting(s), {len(self.pending)} missing from {STATE_FILE}.")
+        if self.flush():
+            with self.lock: self._compact()
+
+    def started(self, key, path=None):
+        with self.lock:
+            self.open[key] = {"event": "start", "key": key, "path": str(path) if path else None, "at": time.time()}
+            self._append(self.open[key])
+
+    def session(self, key, uri):
+        with self.lock:
+            if key in self.open: self.open[key]["uri"] = uri
+            self._append({"event": "session", "key": key, "uri": uri, "at": time.time()})
+
+    def interrupted(self):
+        # uploads with a session URI and no outcome (a crashed run's, once replayed): {key: start entry}
+        with self.lock: return {k: dict(e) for k, e in self.open.items() if e.get("uri")}
+
+    def failed(self, key):
+        # the upload raised before YouTube returned an id: not posted, may be retried next run
+        with self.lock:
+            self.open.pop(key, None); self._append({"event": "failed", "key": key, "at": time.time()})
+
+    def record(self, key, video_id):
+        with self.lock:
+            entry = {"event": "posted", "key": key, "video_id": video_id, "at": time.time()}
+            self.open.pop(key, None); self._append(entry)
+            self.state["posted"].append(key); self.pending.append(entry)
+        if len(self.pending) >= JOURNAL_FLUSH_EVERY or time.monotonic() - self.since >= JOURNAL_FLUSH_SECS:
+            self.flush()
+
+    def flush(self):
+        # one commit + push for all pending postings; True when nothing is left unpushed
+        with self.lock:
+            if not self.pending: return True
+            msg = f"posted {len(self.pending)} video(s)\n\n" + "\n".join(
+                f"{e['key']} -> {e.get('video_id')}" for e in self.pending)
+            with span("state_commit", postings=len(self.pending)):
+                ok = save_and_commit_state(self.state, msg)
+            if ok:
+                self.pending, self.since = [], time.monotonic()
+                self._compact()
+            return ok
+
+# --- Schedule index: prompts.csv keyed by publish time, re-synced only when the CSV changes ---
+class ScheduleIndex:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, ts INTEGER NOT NULL, row TEXT NOT NULL,
+                                         posted INTEGER NOT NULL DEFAULT 0, retry_at INTEGER NOT NULL DEFAULT 0);
+        CREATE INDEX IF NOT EXISTS rows_due ON rows (posted, ts);
+        CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT);
+    """
+
+    def __init__(self, path=SCHEDULE_DB):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.executescript(self.SCHEMA)
+        if "retry_at" not in {c[1] for c in self.db.execute("PRAGMA table_info(rows)")}:  # index from before holds
+            with self.db: self.db.execute("ALTER TABLE rows ADD COLUMN retry_at INTEGER NOT NULL DEFAULT 0")
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.db.close()
+
+    def _meta(self, k):
+        row = self.db.execute("SELECT v FROM meta WHERE k=?", (k,)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, csv_path, posted):
+        # the CSV is re-diffed by key only when its hash moved; posted flags follow the posted list
+        digest = hashlib.sha256(Path(csv_path).read_bytes()).hexdigest()
+        with self.db:
+            if digest != self._meta("csv_sha256"):
+                fresh = {}
+                for r in csv.DictReader(Path(csv_path).open(encoding="utf-8-sig", newline="")):
+                    try: ts = int(parse_pt(r["PublishTime_Pacific"]).timestamp())
+                    except Exception:
+                        print("Bad date, skipping:", r.get("PublishTime_Pacific"), r.get("Title")); continue
+                    fresh[row_key(r)] = (ts, json.dumps(r, ensure_ascii=False))
+                old = dict(((k, (ts, row)) for k, ts, row in self.db.execute("SELECT key, ts, row FROM rows")))
+                gone = [(k,) for k in old if k not in fresh]
+                changed = [(k, ts, row) for k, (ts, row) in fresh.items() if old.get(k) != (ts, row)]
+                self.db.executemany("DELETE FROM rows WHERE key=?", gone)
+                self.db.executemany("INSERT INTO rows (key, ts, row) VALUES (?,?,?) "
+                                    "ON CONFLICT(key) DO UPDATE SET ts=excluded.ts, row=excluded.row", changed)
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('csv_sha256', ?)", (digest,))
+                print(f"Schedule index: {len(changed)} row(s) added/changed, {len(gone)} removed.")
+            # the posted list can also shrink (state reset, a settled upload that never completed): rebuild the
+            # flags whenever it differs from the last sync
+            pdigest = hashlib.sha256("\n".join(sorted(set(posted))).encode()).hexdigest()
+            if pdigest != self._meta("posted_sha256"):
+                self.db.execute("UPDATE rows SET posted=0 WHERE posted=1")
+                self.db.executemany("UPDATE rows SET posted=1 WHERE key=?", [(k,) for k in set(posted)])
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('posted_sha256', ?)", (pdigest,))
+
+    def next_unposted(self, after, n, ready=None):
+        # next n unposted rows after `after`, in schedule order; ready (epoch s) skips held rows
+        cur = self.db.execute("SELECT row FROM rows WHERE posted=0 AND ts>? AND retry_at<=? ORDER BY ts LIMIT ?",
+                              (int(after.timestamp()), int(ready) if ready else 2**62, n))
+        return [json.loads(row) for (row,) in cur]
+
+    def unposted_until(self, after, until, ready=None):
+        # unposted rows publishing in (after, until], in schedule order (ready: as in next_unposted)
+        cur = self.db.execute("SELECT row FROM rows WHERE posted=0 AND ts>? AND ts<=? AND retry_at<=? ORDER BY ts",
+                              (int(after.timestamp()), int(until.timestamp()), int(ready) if ready else 2**62))
+        return [json.loads(row) for (row,) in cur]
+
+    def hold(self, keys, until):
+        # keep rows out of `ready` queries until epoch second `until` (serve's retry delay)
+        with self.db: self.db.executemany("UPDATE rows SET retry_at=? WHERE key=?", [(int(until), k) for k in keys])
+
+    def next_retry(self, after):
+        # earliest epoch second a held unposted row after `after` becomes ready, or None
+        return self.db.execute("SELECT MIN(retry_at) FROM rows WHERE posted=0 AND ts>? AND retry_at>?",
+                               (int(after.timestamp()), int(time.time()))).fetchone()[0]
+
+# --- Render manifest: input hash -> finished MP4, so crashed/retried/pre-rendered rows are not re-encoded ---
+class RenderManifest:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS renders (hash TEXT PRIMARY KEY, path TEXT NOT NULL, bytes INTEGER NOT NULL,
+                                            mtime_ns INTEGER NOT NULL, duration REAL, row TEXT,
+                                            created REAL NOT NULL, inputs TEXT);
+    """
+
+    def __init__(self, path=RENDER_MANIFEST):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path), timeout=30)  # render workers are separate processes
+        self.db.executescript(self.SCHEMA)
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.db.close()
+
+    def get(self, h):
+        # render for hash h if size, mtime and duration still match, else None (stale entries are dropped)
+        hit = self.db.execute("SELECT path, bytes, mtime_ns, duration FROM renders WHERE hash=?", (h,)).fetchone()
+        if not hit: return None
+        path, size, mtime_ns, duration = hit
+        try:
+            st = Path(path).stat()
+            ok = (st.st_size, st.st_mtime_ns) == (size, mtime_ns) and \
+                 abs(ffmpeg_parse_infos(path)["duration"] - duration) < 0.1
+        except (OSError, IOError, KeyError, TypeError):
+            ok = False
+        if not ok:
+            with self.db: self.db.execute("DELETE FROM renders WHERE hash=?", (h,))
+            return None
+        return Path(path)
+
+    def put(self, h, path, row, inputs):
+        st = Path(path).stat()
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO renders VALUES (?,?,?,?,?,?,?,?)",
+                            (h, str(path), st.st_size, st.st_mtime_ns, ffmpeg_parse_infos(str(path))["duration"],
+                             row, time.time(), json.dumps(inputs, ensure_ascii=False)))
+
+    def _drop(self, entries, move_to=None):
+        freed = 0
+        for h, path in entries:
+            p = Path(path)
+            try:
+                freed += p.stat().st_size
+                if move_to: move_to.mkdir(parents=True, exist_ok=True); p.replace(move_to / p.name)
+                else: p.unlink()
+            except OSError: pass
+        with self.db: self.db.executemany("DELETE FROM renders WHERE hash=?", [(h,) for h, _ in entries])
+        return freed
+
+    def prune(self, keep_days=RENDER_KEEP_DAYS):
+        # forget renders older than keep_days and delete their files; returns bytes freed
+        old = self.db.execute("SELECT hash, path FROM renders WHERE created<?",
+                              (time.time() - keep_days*86400,)).fetchall()
+        freed = self._drop(old)
+        if old: print(f"Render manifest: pruned {len(old)} render(s), {freed/1e6:.1f} MB")
+        return freed
+
+    def drop_row(self, row, move_to=None):
+        # every format of a posted row, deleted or moved into move_to; returns bytes dropped from renders/
+        return self._drop(self.db.execute("SELECT hash, path FROM renders WHERE row=?", (row,)).fetchall(), move_to)
+
+# --- Metrics ---
+_ctx = threading.local()
+def set_row(key): _ctx.row = key
+
+def peak_rss_mb():
+    # peak RSS so far of this process and of its largest finished child (ffmpeg), MB
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1))
+
+def metrics_file(t=None):
+    return METRICS_FILE.with_name(f"{METRICS_FILE.stem}-{time.strftime('%Y-%m-%d', time.gmtime(t))}{METRICS_FILE.suffix}")
+
+def emit(rec):
+    # One O_APPEND write per line: pool workers can share the file without interleaving
+    path = metrics_file(rec.get("start"))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try: os.write(fd, (json.dumps(rec, default=str) + "\n").encode())
+    finally: os.close(fd)
+
+@contextmanager
+def span(stage, **fields):
+    # times a stage of the current row; the yielded dict takes extra fields (bytes, frames, cache_hit...)
+    rec = {"run": RUN_ID, "row": getattr(_ctx, "row", None), "stage": stage, "start": round(time.time(), 3), **fields}
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    except BaseException as e:
+        rec["error"] = repr(e); raise
+    finally:
+        rec["duration_s"] = round(time.perf_counter() - t0, 3)
+        rec["peak_rss_mb"], rec["ffmpeg_peak_rss_mb"] = peak_rss_mb()
+        rec["pid"] = os.getpid()
+        emit(rec)
+        print(f"[{stage}] {rec['duration_s']:7.2f}s  {rec['row'] or ''}")
+
+def run_summary(wall, since=0):
+    # per-stage totals of this run's spans started at or after `since` (a time.time()): one record + a table
+    stages, lines, first = {}, [], metrics_file(since).name
+    for p in sorted(METRICS_FILE.parent.glob(f"{METRICS_FILE.stem}-*{METRICS_FILE.suffix}")):
+        if p.name < first: continue  # whole days before `since`
+        try: lines += p.read_text().splitlines()
+        except OSError: pass
+    for ln in lines:
+        try: rec = json.loads(ln)
+        except ValueError: continue
+        if rec.get("run") != RUN_ID or rec.get("stage") == "summary" or rec.get("start", 0) < since: continue
+        st = stages.setdefault(rec["stage"], {"n": 0, "total_s": 0.0, "max_s": 0.0, "bytes": 0, "frames": 0, "errors": 0})
+        st["n"] += 1; st["total_s"] = round(st["total_s"] + rec["duration_s"], 3)
+        st["max_s"] = max(st["max_s"], rec["duration_s"])
+        st["bytes"] += rec.get("bytes") or 0; st["frames"] += rec.get("frames") or 0
+        st["errors"] += "error" in rec
+    emit({"run": RUN_ID, "stage": "summary", "wall_s": round(wall, 3), "peak_rss_mb": peak_rss_mb()[0], "stages": stages})
+    print(f"Run {RUN_ID} summary (wall {wall:.1f}s):")
+    for name, st in stages.items():
+        extra = f"  {st['bytes']/1e6:8.1f} MB" if st["bytes"] else ""
+        if st["bytes"] and name in ("download", "upload"): extra += f" ({st['bytes']/1e6/max(st['total_s'], 1e-3):.1f} MB/s)"
+        extra += f"  {st['frames']} frames" if st["frames"] else ""
+        print(f"  {name:12s} x{st['n']:<3d} total {st['total_s']:8.2f}s  max {st['max_s']:7.2f}s{extra}"
+              + (f"  errors {st['errors']}" if st["errors"] else ""))
+
+def profiled(fn, name, profile):
+    # fn() under cProfile or pyinstrument when asked; reports land in renders/profiles/
+    if not profile: return fn()
+    out = OUT_DIR / "profiles"; out.mkdir(parents=True, exist_ok=True)
+    if profile == "pyinstrument":
+        try: from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument not installed; rendering without profiler"); return fn()
+        prof = Profiler(); prof.start()
+        try: return fn()
+        finally:
+            prof.stop(); (out / f"{name}.html").write_text(prof.output_html())
+    prof = cProfile.Profile()
+    try: return prof.runcall(fn)
+    finally: prof.dump_stats(out / f"{name}.prof")
+
+# --- Cache (safe to restore between CI runs: entries are written atomically and self-describing) ---
+def cache_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+def _touch(p):
+    try: os.utime(p)  # mtime doubles as the LRU clock
+    except OSError: pass
+
+def _publish(tmp, dest):
+    os.replace(tmp, dest)  # atomic: concurrent workers and interrupted runs never leave half files
+
+def cache_get_json(url, params):
+    p = CACHE_DIR / "api" / f"{cache_key(url, params)}.json"
+    try:
+        entry = json.loads(p.read_text())
+        if time.time() - entry["fetched"] < CACHE_TTL_HOURS*3600:
+            _touch(p); return entry["data"]
+    except (OSError, ValueError, KeyError): pass
+    return None
+
+def cache_put_json(url, params, data):
+    p = CACHE_DIR / "api" / f"{cache_key(url, params)}.json"
+    tmp = part_file(p)
+    tmp.write_text(json.dumps({"fetched": time.time(), "url": url, "params": params, "data": data}))
+    _publish(tmp, p)
+
+def media_cache_path(url, suffix):
+    return CACHE_DIR / "media" / f"{cache_key(url)}{suffix}"
+
+def cache_evict(max_mb=CACHE_MAX_MB):
+    # least-recently-used entries go until the cache fits in max_mb; returns bytes freed
+    files = []
+    for sub in ("api", "media", "audio"):
+        d = CACHE_DIR / sub
+        if not d.exists(): continue
+        for p in d.iterdir():
+            try: st = p.stat()
+            except OSError: continue
+            if p.name.endswith(".part") and time.time() - st.st_mtime < 3600: continue  # in-flight
+            files.append((st.st_mtime, st.st_size, p))
+    total, limit, freed = sum(f[1] for f in files), max_mb*1024*1024, 0
+    for _, size, p in sorted(files, key=lambda f: f[0]):
+        if total <= limit: break
+        try: p.unlink(); total -= size; freed += size
+        except OSError: pass
+    if freed: print(f"Cache evicted {freed/1e6:.1f} MB (now {total/1e6:.1f} MB)")
+    return freed
+
+# --- Workspaces: per-row scratch dirs, deleted as soon as the row's render is done ---
+@contextmanager
+def tmp_scope(d):
+    prev, _ctx.tmp = getattr(_ctx, "tmp", None), Path(d)
+    try: yield
+    finally: _ctx.tmp = prev
+
+def _unshared_bytes(root):
+    # files hardlinked from .cache/media free nothing when their link here goes
+    n = 0
+    for dp, _, fs in os.walk(root):
+        for f in fs:
+            try: st = os.stat(os.path.join(dp, f))
+            except OSError: continue
+            if st.st_nlink == 1: n += st.st_size
+    return n
+
+class Workspace:
+    # tmp/w_<pid>_<seq>_<row>/: one row's downloads, stills and MoviePy temp audio; close() is one rmtree
+    reclaimed = 0  # bytes freed by close() in this process, for the end-of-run report
+
+    def __init__(self, key):
+        slug = "".join(c if c.isalnum() else "_" for c in key)[:40]
+        self.dir = TMP_DIR / f"w_{os.getpid()}_{next(_seq)}_{slug}"
+        self.dir.mkdir(parents=True)
+
+    def scope(self): return tmp_scope(self.dir)
+
+    def close(self):
+        # returns bytes reclaimed
+        with span("cleanup") as sp:
+            sp["bytes"] = _unshared_bytes(self.dir)
+            shutil.rmtree(self.dir, ignore_errors=True)
+        Workspace.reclaimed += sp["bytes"]
+        return sp["bytes"]
+
+def sweep_workspaces():
+    # workspaces of processes that are gone (crashed or killed runs); returns bytes reclaimed
+    freed = 0
+    for d in TMP_DIR.glob("w_*"):
+        try: pid = int(d.name.split("_")[1])
+        except (IndexError, ValueError): continue
+        try: os.kill(pid, 0); continue  # still running
+        except ProcessLookupError: pass
+        except PermissionError: continue
+        freed += _unshared_bytes(d); shutil.rmtree(d, ignore_errors=True)
+    if freed: print(f"Removed stale workspaces: {freed/1e6:.1f} MB")
+    return freed
+
+def disk_usage(*roots):
+    return sum(_unshared_bytes(r) for r in roots if r.exists())
+
+def enforce_disk_quota(quota_mb=DISK_QUOTA_MB):
+    # oldest files under tmp/ and renders/ go until they fit (not today's metrics or live *.part)
+    if quota_mb <= 0: return 0
+    files, now, today = [], time.time(), metrics_file()
+    for root in (TMP_DIR, OUT_DIR):
+        for dp, _, fs in os.walk(root):
+            for f in fs:
+                p = Path(dp) / f
+                try: st = p.stat()
+                except OSError: continue
+                if p == today or (".part" in p.name and now - st.st_mtime < 3600): continue
+                files.append((st.st_mtime, st.st_size if st.st_nlink == 1 else 0, p))
+    total, limit, freed = sum(f[1] for f in files), quota_mb*1024*1024, 0
+    with span("disk_quota") as sp:
+        for _, size, p in sorted(files, key=lambda f: f[0]):
+            if total <= limit: break
+            try: p.unlink(); total -= size; freed += size
+            except OSError: pass
+        sp["bytes"] = freed
+    if freed: print(f"Disk quota: evicted {freed/1e6:.1f} MB from tmp/ + renders/ (now {total/1e6:.1f} MB)")
+    return freed
 
 # --- Pexels (free, documented) ---
+def pexels_get(url, params):
+    with span("pexels_api", query=params.get("query")) as sp:
+        data = cache_get_json(url, params); sp["cache_hit"] = data is not None
+        if data is not None: return data
+        r = requests.get(url, headers={"Authorization": PEXELS_API_KEY}, params=params, timeout=30)
+        r.raise_for_status(); sp["bytes"] = len(r.content)
+        data = r.json(); cache_put_json(url, params, data)
+        return data
+
+def rendition_mb(f, duration):
+    # Pexels' own size when present, else ~0.1 bit/pixel of H.264
+    if f.get("size"): return f["size"] / 1e6
+    return f["width"] * f["height"] * (f.get("fps") or 30) * (duration or TARGET_DURATION) * 0.1 / 8 / 1e6
+
+def score_rendition(f, duration):
+    # lower is better, None = unusable: crop shortfall, excess decode pixels, fps, size and looping
+    w, h, fps = f.get("width") or 0, f.get("height") or 0, f.get("fps") or 0
+    if not (w and h and f.get("link")) or f.get("file_type", "video/mp4") != "video/mp4": return None
+    mb = rendition_mb(f, duration)
+    if mb > PEXELS_MAX_MB: return None
+    res = min(min(w, h*W/H) / W, min(h, w*H/W) / H)       # scale of the cropped 9:16 region vs the output
+    score = max(0.0, 1 - res) * 4                          # upscaling blurs: 720x1280 -> 1.33
+    score += max(0.0, math.log2(w*h / (W*H))) * 0.5        # 4K decodes 4x the pixels -> 1.0
+    score += abs(math.log2(fps / FPS)) * 0.5 if fps else 0.25  # 60 fps: twice the decode, half dropped
+    score += mb / PEXELS_MAX_MB
+    if duration and duration < TARGET_DURATION:
+        score += min(2.0, (TARGET_DURATION/duration - 1) * 0.3)  # visible loop seams
+    return score
+
 def pexels_video(keyword):
+    # best-scoring rendition over up to PEXELS_MAX_PAGES pages (any orientation: it is cover-cropped), or None
+    best, seen = None, 0
     try:
-        r = requests.get("https://api.pexels.com/videos/search",
-                         headers={"Authorization": PEXELS_API_KEY},
-                         params={"query": keyword, "per_page": 5}, timeout=30)
-        r.raise_for_status()
-        for v in r.json().get("videos", []):
-            for f in sorted(v.get("video_files", []), key=lambda x: x.get("width", 0)):
-                w,h,link = f.get("width"), f.get("height"), f.get("link")
-                if w and h and link and h > w:
-                    return link
+        for page in range(1, PEXELS_MAX_PAGES + 1):
+            data = pexels_get("https://api.pexels.com/videos/search",
+                              {"query": keyword, "per_page": PEXELS_PER_PAGE, "page": page})
+            for v in data.get("videos", []):
+                for f in v.get("video_files", []):
+                    seen += 1
+                    score = score_rendition(f, v.get("duration"))
+                    if score is not None and (best is None or score < best["score"]):
+                        best = {"link": f["link"], "video_id": v.get("id"), "width": f["width"], "height": f["height"],
+                                "fps": f.get("fps"), "duration": v.get("duration"), "quality": f.get("quality"),
+                                "mb": round(rendition_mb(f, v.get("duration")), 1), "score": round(score, 3), "page": page}
+            if (best and best["score"] <= PEXELS_GOOD_SCORE) or not data.get("next_page"): break
     except requests.RequestException as e:
         print("Pexels video API error:", e)
-    return None
+    if best:
+        with span("pexels_pick", query=keyword, candidates=seen, **{k: v for k, v in best.items() if k != "link"}): pass
+    return best
 
 def pexels_photos(q, need=6):
     try:
-        r = requests.get("https://api.pexels.com/v1/search",
-                         headers={"Authorization": PEXELS_API_KEY},
-                         params={"query": q, "per_page": need, "orientation": "portrait"},
-                         timeout=30)
-        r.raise_for_status()
+        data = pexels_get("https://api.pexels.com/v1/search",
+                          {"query": q, "per_page": need, "orientation": "portrait"})
         out = []
-        for p in r.json().get("photos", []):
+        for p in data.get("photos", []):
             src = p.get("src", {}); link = src.get("large") or src.get("portrait") or src.get("large2x")
             if link: out.append(link)
         return out[:need]
@@ -90,194 +653,1077 @@ def pexels_photos(q, need=6):
         return []
 
 def download(url, dest: Path):
-    with requests.get(url, stream=True, timeout=60) as r:
-        r.raise_for_status()
-        with open(dest,"wb") as f:
-            for ch in r.iter_content(8192):
-                if ch: f.write(ch)
+    cp = media_cache_path(url, dest.suffix)
+    with span("download", cache_hit=cp.exists()) as sp:
+        if not sp["cache_hit"]:
+            tmp = part_file(cp)
+            with requests.get(url, stream=True, timeout=60) as r:
+                r.raise_for_status()
+                with open(tmp,"wb") as f:
+                    for ch in r.iter_content(8192):
+                        if ch: f.write(ch)
+            _publish(tmp, cp); sp["bytes"] = cp.stat().st_size
+        else:
+            _touch(cp)
+        try: os.link(cp, dest)
+        except OSError: shutil.copyfile(cp, dest)
+
+# --- Music: only the window a video uses is decoded, and the finished bed is cached per track+offset ---
+AUDIO_RATE = 44100
+
+def pick_music(seed=None):
+    # seeded by the row key: a re-render of the same row gets the same track and window
+    if not MUSIC_DIR.exists(): return None
+    tr = sorted(p for p in MUSIC_DIR.iterdir() if p.suffix.lower() in {".mp3",".wav",".m4a"})
+    return random.Random(seed).choice(tr) if tr else None
+
+@functools.lru_cache(maxsize=256)
+def _track_seconds(path, mtime, size):
+    return ffmpeg_parse_infos(path).get("duration") or 0.0
+
+def music_offset(track, seed=None, duration=None):
+    # a random point on the MUSIC_STEP_S grid that leaves `duration` s of track
+    duration = duration or TARGET_DURATION
+    st = Path(track).stat()
+    steps = int(max(0.0, _track_seconds(str(track), st.st_mtime, st.st_size) - duration) // MUSIC_STEP_S)
+    return random.Random(seed).randint(0, steps) * MUSIC_STEP_S
+
+def shape_bed(pcm, gain=None, rate=AUDIO_RATE):
+    # float32 (n, 2) in [-1, 1]: peak-normalized (boost capped at 4x), gained, faded in/out, in place
+    gain = MUSIC_GAIN if gain is None else gain
+    peak = max(float(pcm.max()), -float(pcm.min())) if len(pcm) else 0.0
+    pcm *= gain * (min(0.98 / peak, 4.0) if peak > 0 else 1.0)
+    fi, fo = min(len(pcm), int(MUSIC_FADE_IN*rate)), min(len(pcm), int(MUSIC_FADE_OUT*rate))
+    if fi: pcm[:fi] *= np.linspace(0, 1, fi, dtype=np.float32)[:, None]
+    if fo: pcm[len(pcm)-fo:] *= np.linspace(1, 0, fo, dtype=np.float32)[:, None]
+    return pcm
+
+def music_bed(track, seed=None, duration=None):
+    # ready-to-mux 16-bit WAV of just the window this video uses (None passes through)
+    if not track: return None
+    duration = duration or TARGET_DURATION
+    st = Path(track).stat()
+    offset = music_offset(track, seed, duration)
+    p = CACHE_DIR / "audio" / f"{cache_key(str(track), st.st_mtime, st.st_size, offset, duration, MUSIC_GAIN, MUSIC_FADE_IN, MUSIC_FADE_OUT)}.wav"
+    with span("audio", track=Path(track).name, offset=offset) as sp:
+        if p.exists():
+            _touch(p); sp["cached"] = True; return p
+        raw = subprocess.run([ffmpeg_bin(), "-loglevel", "error", "-ss", str(offset), "-t", str(duration),
+                              "-i", str(track), "-f", "s16le", "-ac", "2", "-ar", str(AUDIO_RATE), "-"],
+                             capture_output=True, check=True).stdout
+        pcm = np.frombuffer(raw, np.int16).reshape(-1, 2).astype(np.float32); del raw
+        pcm *= 1/32768; shape_bed(pcm)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = part_file(p)
+        with wave.open(str(tmp), "wb") as wf:
+            wf.setnchannels(2); wf.setsampwidth(2); wf.setframerate(AUDIO_RATE)
+            pcm *= 32768; np.clip(pcm, -32768, 32767, out=pcm)
+            wf.writeframes(pcm.astype(np.int16).tobytes())
+        _publish(tmp, p); sp["cached"] = False
+    return p
 
 # --- Visual helpers ---
-def render_text_img(text, w, h, font_size=64, fill=(255,255,255), bg=(11,31,59,200)):
-    img = Image.new("RGBA",(w,h),(0,0,0,0))
-    d = ImageDraw.Draw(img); d.rectangle([0,0,w,h], fill=bg)
-    try: font = ImageFont.truetype("DejaVuSans-Bold.ttf", font_size)
-    except: font = ImageFont.load_default()
-    words, lines, line = text.split(), [], ""
-    for w1 in words:
-        test = (line + " " + w1).strip()
-        if d.textlength(test, font=font) > w-80:
-            if line: lines.append(line); line = w1
-        else: line = test
-    if line: lines.append(line)
+# Text: fonts, layouts and rendered bars are memoized per process (many rows share OverlayText)
+@functools.lru_cache(maxsize=None)
+def load_font(size, name="DejaVuSans-Bold.ttf"):
+    try: return ImageFont.truetype(name, size)
+    except OSError: return ImageFont.load_default()
+
+@functools.lru_cache(maxsize=4096)
+def _word_len(word, size):
+    return load_font(size).getlength(word)
+
+@functools.lru_cache(maxsize=512)
+def layout_text(text, w, font_size=64):
+    # greedy wrap to w-80 px from cached word widths -> ((line, x), ...) centred in w
+    font, limit, space = load_font(font_size), w - 80, _word_len(" ", font_size)
+    lines, line, width = [], [], 0.0
+    for word in text.split():
+        ww = _word_len(word, font_size)
+        if line and width + space + ww > limit:
+            lines.append(" ".join(line)); line, width = [word], ww
+        else:
+            width += (space if line else 0) + ww; line.append(word)
+    if line: lines.append(" ".join(line))
+    return tuple((ln, int((w - font.getlength(ln))/2)) for ln in lines)
+
+@functools.lru_cache(maxsize=16)  # ~0.9 MB per 1080-wide bar
+def render_text_rgba(text, w, h, font_size=64, fill=(255,255,255), bg=(11,31,59,200)):
+    # read-only uint8 (h, w, 4), shared through the cache: copy before writing
+    img = Image.new("RGBA",(w,h),bg)
+    d, font = ImageDraw.Draw(img), load_font(font_size)
+    lines = layout_text(text, w, font_size)
     y = int((h - len(lines)*font_size*1.1)/2)
-    for ln in lines:
-        tw = d.textlength(ln, font=font); x = int((w - tw)/2)
+    for ln, x in lines:
         d.text((x,y), ln, font=font, fill=fill); y += int(font_size*1.1)
-    p = TMP_DIR / f"t_{int(time.time()*1000)}.png"; img.save(p); return str(p)
+    a = np.asarray(img); a.flags.writeable = False
+    return a
+
+@functools.lru_cache(maxsize=8)  # ~3.5 MB of float32 per entry; a batch repeats a handful of OverlayText
+def _overlay_layers(text, opacity, w, h, bar):
+    txt = render_text_rgba(text, w, h).astype(np.float32) / 255
+    a_t = txt[..., 3:]
+    inv = ((1 - opacity) * (1 - a_t)).astype(np.float32)
+    rgb = np.asarray(bar, np.float32) * opacity * (1 - a_t) + txt[..., :3] * 255 * a_t
+    premul = (rgb + 0.5).astype(np.float32)  # +0.5: the uint8 store in apply() truncates
+    inv.flags.writeable = premul.flags.writeable = False
+    return inv, premul
+
+class Overlay:
+    # bar + text pre-blended into one premultiplied layer: frame[:h] = frame[:h]*inv + premul
+    def __init__(self, text, opacity, w=W, h=BAR_H, bar=(11,31,59)):
+        self.inv, self.premul = _overlay_layers(text, opacity, w, h, tuple(bar))  # shared, read-only
+        self.h, self._buf, self._acc = h, None, np.empty((h, w, 3), np.float32)
+
+    def rgba(self):
+        # straight-alpha uint8 RGBA of the flattened layer, for ffmpeg's overlay
+        a = 1 - self.inv
+        rgb = np.where(a > 0, (self.premul - 0.5) / np.maximum(a, 1e-6), 0)
+        return np.dstack([np.clip(rgb, 0, 255), a*255]).round().astype(np.uint8)
+
+    def apply(self, frame):
+        # One reused output buffer: MoviePy's writer consumes each frame before asking for the next
+        if self._buf is None or self._buf.shape != frame.shape: self._buf = np.empty(frame.shape, np.uint8)
+        np.copyto(self._buf, frame, casting="unsafe")
+        region = self._buf[:self.h]
+        np.multiply(region, self.inv, out=self._acc); self._acc += self.premul
+        np.copyto(region, self._acc, casting="unsafe")
+        return self._buf
+
+def fit_vf(w, h, fps=None):
+    # ffmpeg chain: centre-crop to the w:h aspect, scale to w x h, resample to fps
+    fps = fps or FPS
+    return (f"crop='min(iw,trunc(ih*{w}/{h}/2)*2)':'min(ih,trunc(iw*{h}/{w}/2)*2)',"
+            f"scale={w}:{h},setsar=1,fps={fps}")
+
+class ScaledVideoReader:
+    # final-size RGB frames from ffmpeg; loops and out-of-order reads restart the decoder at that frame
+    def __init__(self, path, w=W, h=H, fps=None):
+        self.path, self.w, self.h, self.fps = path, w, h, fps or FPS
+        self.loop_frames = max(1, int(ffmpeg_parse_infos(path)["video_duration"] * self.fps))
+        self.proc, self.pos, self.last = None, None, None
+
+    def _open(self, i):
+        self.close()
+        self.proc = subprocess.Popen([ffmpeg_bin(), "-loglevel", "error", "-ss", f"{i/self.fps:.6f}", "-i", self.path,
+                                      "-vf", fit_vf(self.w, self.h, self.fps), "-an", "-f", "rawvideo",
+                                      "-pix_fmt", "rgb24", "-"], stdout=subprocess.PIPE, bufsize=self.w*self.h*3)
+        self.pos = i
+
+    def frame(self, t):
+        i = int(round(t*self.fps, 6)) % self.loop_frames
+        if self.last is not None and i == self.pos - 1: return self.last  # same frame asked twice
+        if self.proc is None or i != self.pos: self._open(i)
+        n = self.w*self.h*3
+        buf = self.proc.stdout.read(n)
+        if len(buf) < n:
+            if i == 0:
+                if self.last is None: raise IOError(f"no frames decoded from {self.path}")
+                return self.last
+            self.loop_frames = i  # container duration overstated the stream: loop here
+            return self.frame(0)
+        self.pos, self.last = i + 1, np.frombuffer(buf, np.uint8).reshape(self.h, self.w, 3)
+        return self.last
+
+    def close(self):
+        if self.proc:
+            self.proc.kill(); self.proc.stdout.close(); self.proc.wait()  # decoder only: nothing to flush
+            self.proc = None
+
+    __del__ = close
+
+class ScaledVideoClip(VideoClip):
+    def __init__(self, path, duration, w=W, h=H, fps=None):
+        self.source = ScaledVideoReader(path, w, h, fps)
+        VideoClip.__init__(self, make_frame=self.source.frame, duration=duration)
+        self.fps = self.source.fps
+
+    def close(self):
+        self.source.close()
 
 def build_from_video(vpath, overlay):
-    clip = VideoFileClip(vpath); w,h = clip.w, clip.h
-    target = W/H
-    if abs(w/h - target) > 0.01:
-        new_w = int(h*target); x1 = max(0,(w-new_w)//2)
-        clip = crop(clip, x1=x1, y1=0, x2=x1+new_w, y2=h)
-    clip = clip.resize((W,H))
-    if clip.duration < TARGET_DURATION:
-        loops = math.ceil(TARGET_DURATION/clip.duration)
-        clip = concatenate_videoclips([clip]*loops).subclip(0, TARGET_DURATION)
-    else:
-        clip = clip.subclip(0, TARGET_DURATION)
-    bar = ColorClip((W,200), color=(11,31,59)).set_duration(TARGET_DURATION).set_opacity(0.7).set_position(("center","top"))
-    txt = ImageClip(render_text_img(overlay,W,200)).set_duration(TARGET_DURATION).set_position(("center","top"))
-    return CompositeVideoClip([clip, bar, txt])
+    clip = ScaledVideoClip(vpath, TARGET_DURATION)
+    return clip.fl_image(Overlay(overlay, 0.7).apply)
+
+def decode_photo(path, sizes):
+    # JPEG draft mode: decoded (DCT-domain downscale) only as far as the largest size in sizes allows
+    with Image.open(path) as src:  # closes the file now, not at garbage collection
+        iw, ih = src.size
+        s = max(max(w/iw, h/ih) for w, h in sizes)
+        src.draft("RGB", (math.ceil(iw*s), math.ceil(ih*s)))
+        return src.convert("RGB")
+
+def cover_buffer(photo, w, h):
+    # cover-crop + scale a photo (path or decode_photo image) to w x h RGB
+    im = photo if isinstance(photo, Image.Image) else decode_photo(photo, [(w, h)])
+    iw, ih = im.size
+    s = max(w/iw, h/ih); cw, ch = w/s, h/s
+    return np.asarray(im.resize((w, h), Image.LANCZOS, box=((iw-cw)/2, (ih-ch)/2, (iw+cw)/2, (ih+ch)/2)))
+
+class KenBurnsClip(VideoClip):
+    # photos (paths or decode_photo images) -> pan/zoom slides with crossfades, O(output pixels) a frame
+    def __init__(self, photos, duration, w=W, h=H, zoom=None, xfade=None):
+        xfade = KB_XFADE if xfade is None else xfade
+        self.out_w, self.out_h = w, h
+        self.bw, self.bh = self.buffer_size(w, h, zoom)
+        self.bufs = [cover_buffer(p, self.bw, self.bh) for p in photos]
+        self.per = duration / len(photos)
+        self.xfade = min(xfade, self.per/2)
+        self._mix, self._tmp = np.empty((h, w, 3), np.uint16), np.empty((h, w, 3), np.uint16)
+        self._out, self._zoom = np.empty((h, w, 3), np.uint8), np.empty((h, w, 3), np.uint8)
+        self._rows = np.empty((h, self.bw, 3), np.uint8)
+        VideoClip.__init__(self, make_frame=self.frame, duration=duration)
+
+    @staticmethod
+    def buffer_size(w, h, zoom=None):
+        zoom = zoom or KB_ZOOM
+        return max(w, 2*round(w*zoom/2)), max(h, 2*round(h*zoom/2))
+
+    def view(self, i, t):
+        w, h, bw, bh = self.out_w, self.out_h, self.bw, self.bh
+        u = min(max((t - i*self.per + self.xfade) / (self.per + self.xfade), 0.0), 1.0)
+        u = u*u*(3 - 2*u)  # ease in/out
+        buf = self.bufs[i]
+        if i % 2:
+            if (i//2) % 2: u = 1 - u  # alternate pan direction
+            x, y = round((bw-w)*u), round((bh-h)*(1-u))
+            return buf[y:y+h, x:x+w]
+        cw, ch = bw - (bw-w)*u, bh - (bh-h)*u
+        cols = ((bw-cw)/2 + (np.arange(w) + 0.5)*cw/w).astype(np.intp)
+        rows = ((bh-ch)/2 + (np.arange(h) + 0.5)*ch/h).astype(np.intp)
+        np.take(buf, rows, axis=0, out=self._rows, mode="clip")  # "raise" would buffer a copy of out
+        cut = np.flatnonzero(np.diff(cols) != 1) + 1  # zoom <= KB_ZOOM: long runs, few cuts
+        for a, b in zip(np.r_[0, cut], np.r_[cut, w]):
+            self._zoom[:, a:b] = self._rows[:, cols[a]:cols[a] + b - a]
+        return self._zoom
+
+    def close(self):
+        self.bufs.clear()  # shared by fl() copies: frees the decoded photos for all of them
+
+    def frame(self, t):
+        i = min(int(t // self.per), len(self.bufs) - 1)
+        a, rem = self.view(i, t), (i+1)*self.per - t
+        if i + 1 == len(self.bufs) or rem >= self.xfade: return a
+        k = int(256 * (1 - rem/self.xfade))  # 0..256 weight of the incoming slide
+        np.multiply(a, 256 - k, out=self._mix, dtype=np.uint16)
+        np.multiply(self.view(i+1, t), k, out=self._tmp, dtype=np.uint16)
+        self._mix += self._tmp; self._mix >>= 8
+        np.copyto(self._out, self._mix, casting="unsafe")
+        return self._out
 
 def build_from_photos(paths, overlay):
-    per = max(5, int(TARGET_DURATION/max(1,len(paths))))
-    clips = [ImageClip(p).resize(height=H).resize(width=W).set_duration(per) for p in paths]
-    video = concatenate_videoclips(clips).subclip(0, TARGET_DURATION)
-    bar = ColorClip((W,200), color=(11,31,59)).set_duration(TARGET_DURATION).set_opacity(0.7).set_position(("center","top"))
-    txt = ImageClip(render_text_img(overlay,W,200)).set_duration(TARGET_DURATION).set_position(("center","top"))
-    return CompositeVideoClip([video, bar, txt])
+    return KenBurnsClip(paths, TARGET_DURATION).fl_image(Overlay(overlay, 0.7).apply)
+
+def fallback_frame(overlay, w=W, h=H):
+    # Two flat color halves + text — no network needed. Every frame is identical, so build it once.
+    frame = np.empty((h,w,3), np.uint8); frame[:h//2] = (11,31,59); frame[h//2:] = (7,20,40)
+    return Overlay(overlay, 0.8, w=w).apply(frame).copy()
 
 def build_fallback(overlay):
-    # Animated gradient bars + text — no network needed
-    bg_top = ColorClip((W,H//2), color=(11,31,59)).set_duration(TARGET_DURATION)
-    bg_bot = ColorClip((W,H//2), color=(7,20,40)).set_duration(TARGET_DURATION).set_position((0,H//2))
-    bar = ColorClip((W,200), color=(11,31,59)).set_duration(TARGET_DURATION).set_opacity(0.8).set_position(("center","top"))
-    txt = ImageClip(render_text_img(overlay,W,200)).set_duration(TARGET_DURATION).set_position(("center","top"))
-    return CompositeVideoClip([bg_top, bg_bot, bar, txt])
+    return ImageClip(fallback_frame(overlay)).set_duration(TARGET_DURATION)
+
+def is_static(clip):
+    # every frame provably identical: untransformed ImageClips at fixed positions
+    if isinstance(clip, ImageClip):
+        return clip.make_frame(0) is clip.img  # fl()/time effects replace make_frame
+    if isinstance(clip, CompositeVideoClip) and clip.make_frame.__qualname__.startswith("CompositeVideoClip."):
+        end = clip.duration or 0
+        return all(is_static(c) and (c.mask is None or is_static(c.mask)) and c.start == 0
+                   and (c.end is None or c.end >= end) and c.pos(0) == c.pos(end) for c in clip.clips)
+    return False
+
+def build_clip(kind, paths, overlay):
+    if kind == "video": return build_from_video(paths[0], overlay)
+    if kind == "photos": return build_from_photos(paths, overlay)
+    return build_fallback(overlay)
+
+# --- Encoder profiles: YouTube re-encodes every Short, so the upload only has to be a good mezzanine ---
+# gop in seconds; maxrate/bufsize cap CRF peaks (None: uncapped); audio is the AAC bitrate
+ENCODER_PROFILES = {
+    "fast-draft": {"preset": "ultrafast", "crf": 28, "maxrate": None,  "bufsize": None,  "tune": None,
+                   "gop": 2,   "audio": "96k"},
+    "upload":     {"preset": "veryfast",  "crf": 20, "maxrate": "16M", "bufsize": "32M", "tune": None,
+                   "gop": 0.5, "audio": "192k"},  # YouTube: closed GOP of half the frame rate
+    "archive":    {"preset": "slow",      "crf": 17, "maxrate": None,  "bufsize": None,  "tune": "film",
+                   "gop": 2,   "audio": "256k"},
+}
+
+def usable_cpus():
+    try: return len(os.sched_getaffinity(0))  # honours container/cgroup CPU pinning
+    except AttributeError: return os.cpu_count() or 1
+
+def auto_threads(workers=1):
+    return max(1, usable_cpus() // max(1, workers))
+
+# Pool workers get these from the parent (set at run time: run id, CLI and bench overrides), not from fork
+WORKER_SETTINGS = ("RUN_ID", "TARGET_DURATION", "FPS", "RENDER_SEGMENTS", "CACHE_DIR")
+
+def _worker_init(settings):
+    globals().update(settings)
+
+def process_pool(workers):
+    # forkserver, not fork: the parent has fetch/upload threads running, and a forked child would inherit
+    # whatever locks they hold (requests, print, sqlite). The server preloads this module, so workers start warm.
+    ctx = mp.get_context("forkserver"); ctx.set_forkserver_preload(["make_videos"])
+    return ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_worker_init,
+                               initargs=({k: globals()[k] for k in WORKER_SETTINGS},))
+
+def x264_opts(encoder=None):
+    # rate control, tune and GOP options of a profile, shared by the ffmpeg and MoviePy writers
+    e = ENCODER_PROFILES[encoder or ENCODER_PROFILE]
+    opts = ["-crf", str(e["crf"])]
+    if e["maxrate"]: opts += ["-maxrate", e["maxrate"], "-bufsize", e["bufsize"]]
+    if e["tune"]: opts += ["-tune", e["tune"]]
+    return opts + ["-g", str(max(1, round(e["gop"]*FPS))), "-movflags", "+faststart"]
+
+def encoder_args(encoder=None, threads=None):
+    # (video args, audio args) for an ffmpeg command line
+    e = ENCODER_PROFILES[encoder or ENCODER_PROFILE]
+    video = ["-c:v", "libx264", "-preset", e["preset"], *x264_opts(encoder),
+             "-threads", str(threads or auto_threads()), "-pix_fmt", "yuv420p"]
+    return video, ["-c:a", "aac", "-b:a", e["audio"]]
+
+def still_render(frame, music, out_file, threads=RENDER_THREADS, duration=None, encoder=None):
+    # one frame + the music bed: a single 1 s GOP is encoded, then looped to `duration` by stream copy
+    duration = duration or TARGET_DURATION
+    stem = tmp_file("still", "")
+    png, gop = stem.with_suffix(".png"), stem.with_suffix(".mp4")
+    Image.fromarray(np.asarray(frame, np.uint8)).save(png)
+    ff = [ffmpeg_bin(), "-y", "-loglevel", "error"]
+    video, audio = encoder_args(encoder, threads)
+    subprocess.run([*ff, "-i", str(png), "-vf", f"loop=-1:1,fps={FPS}", "-frames:v", str(FPS),
+                    *video, str(gop)], check=True)
+    args, maps = ["-stream_loop", "-1", "-i", str(gop)], ["-map", "0:v", "-c:v", "copy"]
+    if music:
+        args += ["-i", str(music)]; maps += ["-map", "1:a", *audio]
+    subprocess.run([*ff, *args, *maps, "-frames:v", str(round(duration*FPS)), "-t", str(duration),
+                    "-movflags", "+faststart", str(out_file)], check=True)
+
+def moviepy_render(kind, paths, overlay, music, out_file, threads=RENDER_THREADS, encoder=None):
+    # stats: frames encoded and seconds spent compositing them in Python
+    final = audio = None
+    try:
+        final = build_clip(kind, paths, overlay)
+        if is_static(final):
+            # Nothing moves: skip the per-frame composite/encode pipe and loop a single still in ffmpeg
+            still_render(final.get_frame(0), music, out_file, threads, final.duration, encoder)
+            return {"frames": round(final.duration*FPS), "static": True}
+        if music:
+            audio = AudioFileClip(str(music))
+            final = final.set_audio(audio.subclip(0, min(audio.duration, final.duration)))
+        composite = [0.0]
+        def clocked(gf, t):
+            t0 = time.perf_counter(); frame = gf(t); composite[0] += time.perf_counter() - t0; return frame
+        final = final.fl(clocked)
+        e = ENCODER_PROFILES[encoder or ENCODER_PROFILE]
+        final.write_videofile(str(out_file), fps=FPS, codec="libx264", preset=e["preset"], threads=threads or auto_threads(),
+                              audio_codec="aac", audio_bitrate=e["audio"], ffmpeg_params=x264_opts(encoder),
+                              temp_audiofile=str(tmp_file("snd", ".m4a")))
+        return {"frames": round(final.duration*FPS), "composite_s": round(composite[0], 3)}
+    finally:
+        # VideoClip.close() leaves the audio reader's ffmpeg running; close both explicitly
+        for c in (final, audio):
+            try:
+                if c: c.close()
+            except: pass
+
+# --- ffmpeg engine: same templates as one filtergraph, no per-frame Python ---
+def ffmpeg_bin():
+    from moviepy.config import get_setting
+    return get_setting("FFMPEG_BINARY")
+
+def ffmpeg_graph(kind, paths):
+    # input args + filtergraph producing [bg] for a template
+    if kind != "video": raise ValueError(f"no filtergraph for template {kind!r}")
+    return ["-stream_loop", "-1", "-i", paths[0]], f"[0:v]{fit_vf(W, H)}[bg]"
+
+def overlay_png(text, opacity, w=W):
+    # content-addressed: rows (and pool workers) sharing OverlayText reuse one file
+    p = TMP_DIR / f"ov_{cache_key(text, opacity, w, BAR_H)[:16]}.png"
+    if not p.exists():
+        tmp = part_file(p)
+        Image.fromarray(Overlay(text, opacity, w=w).rgba(), "RGBA").save(tmp, format="PNG"); _publish(tmp, p)
+    return str(p)
+
+def ffmpeg_render(kind, paths, overlay, music, out_file, threads=RENDER_THREADS, encoder=None):
+    if kind == "fallback":  # static template: one frame, looped
+        still_render(fallback_frame(overlay), music, out_file, threads, encoder=encoder)
+        return {"frames": round(TARGET_DURATION*FPS), "static": True}
+    args, graph = ffmpeg_graph(kind, paths)
+    n = len(paths)
+    args += ["-i", overlay_png(overlay, 0.7)]
+    graph += f";[bg][{n}:v]overlay=0:0,format=yuv420p[v]"
+    maps = ["-map", "[v]"]
+    video, audio = encoder_args(encoder, threads)
+    if music:
+        args += ["-i", str(music)]
+        maps += ["-map", f"{n+1}:a", *audio]
+    cmd = [ffmpeg_bin(), "-y", "-loglevel", "error", *args, "-filter_complex", graph, *maps,
+           "-t", str(TARGET_DURATION), "-r", str(FPS), *video, str(out_file)]
+    subprocess.run(cmd, check=True)
+    return {"frames": round(TARGET_DURATION*FPS)}
+
+def pick_engine(kind, engine):
+    # the filtergraph has no Ken Burns motion or crossfades; photo rows keep the MoviePy template
+    return "moviepy" if engine == "ffmpeg" and kind == "photos" else engine
+
+def render_media(kind, paths, overlay, music, out_file, threads=RENDER_THREADS, engine=RENDER_ENGINE, encoder=None):
+    # music: a finished bed from music_bed() or None; encoder: a profile name
+    engine = pick_engine(kind, engine)
+    render = {"ffmpeg": ffmpeg_render, "segments": segments_render}.get(engine, moviepy_render)
+    return render(kind, paths, overlay, music, out_file, threads, encoder)
+
+def raw_input_args(w, h):
+    # rgb24 frames of w x h on stdin at FPS
+    return ["-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{w}x{h}", "-r", str(FPS), "-i", "-"]
+
+# --- Segments engine: one video's timeline in parallel processes, joined without re-encoding ---
+def segment_count(threads=None):
+    return RENDER_SEGMENTS or threads or auto_threads()
+
+def segment_bounds(n, encoder=None):
+    # frame ranges [a, b) of up to n segments, each cut on a GOP boundary of the encoder profile
+    frames = round(TARGET_DURATION*FPS)
+    gop = max(1, round(ENCODER_PROFILES[encoder or ENCODER_PROFILE]["gop"]*FPS))
+    gops = math.ceil(frames / gop); n = max(1, min(n, gops))
+    cuts = [min(frames, round(k*gops/n)*gop) for k in range(n)] + [frames]
+    return list(zip(cuts, cuts[1:]))
+
+def _render_segment(kind, paths, overlay, a, b, seg_file, threads, encoder, workdir):
+    # Pool entry point: frames a..b-1 of the MoviePy template, video only, same encoder settings as a single
+    # pass. Returns seconds spent compositing.
+    with tmp_scope(workdir):
+        clip, composite = build_clip(kind, paths, overlay), 0.0
+        video, _ = encoder_args(encoder, threads)
+        proc = subprocess.Popen([ffmpeg_bin(), "-y", "-loglevel", "error", *raw_input_args(W, H), "-an", *video,
+                                 str(seg_file)], stdin=subprocess.PIPE)
+        try:
+            for i in range(a, b):
+                t0 = time.perf_counter()
+                frame = np.ascontiguousarray(clip.get_frame(i/FPS), np.uint8)
+                composite += time.perf_counter() - t0
+                proc.stdin.write(frame.data)
+        except BaseException:
+            proc.kill(); raise
+        finally:
+            clip.close()
+            try: proc.stdin.close()
+            except BrokenPipeError: pass
+        if proc.wait(): raise subprocess.CalledProcessError(proc.returncode, "ffmpeg")
+        return composite
+
+def concat_segments(segs, music, out_file, encoder=None):
+    # concat demuxer (-c copy, no re-encode); the music bed is muxed once here
+    lst = tmp_file("concat", ".txt")
+    lst.write_text("".join(f"file '{Path(p).resolve()}'\n" for p in segs))
+    args, maps = ["-f", "concat", "-safe", "0", "-i", str(lst)], ["-map", "0:v", "-c:v", "copy"]
+    if music:
+        args += ["-i", str(music)]; maps += ["-map", "1:a", *encoder_args(encoder)[1]]
+    subprocess.run([ffmpeg_bin(), "-y", "-loglevel", "error", *args, *maps, "-t", str(TARGET_DURATION),
+                    "-movflags", "+faststart", str(out_file)], check=True)
+
+def segments_render(kind, paths, overlay, music, out_file, threads=RENDER_THREADS, encoder=None):
+    # segment_count() GOP-aligned slices rendered in parallel processes, then concatenated
+    if kind == "fallback":  # static: nothing to parallelize
+        return moviepy_render(kind, paths, overlay, music, out_file, threads, encoder)
+    bounds = segment_bounds(segment_count(threads), encoder)
+    per = max(1, (threads or auto_threads()) // len(bounds))
+    segs = [tmp_file(f"seg{k}", ".mp4") for k in range(len(bounds))]
+    workdir = getattr(_ctx, "tmp", None) or TMP_DIR
+    try:
+        with process_pool(len(bounds)) as pool:
+            futs = [pool.submit(_render_segment, kind, paths, overlay, a, b, seg, per, encoder, workdir)
+                    for (a, b), seg in zip(bounds, segs)]
+            composite = [f.result() for f in futs]
+        t0 = time.perf_counter()
+        concat_segments(segs, music, out_file, encoder)
+        return {"frames": bounds[-1][1], "segments": len(bounds), "composite_s": round(sum(composite), 3),
+                "concat_s": round(time.perf_counter() - t0, 3)}
+    finally:
+        for seg in segs: seg.unlink(missing_ok=True)
+
+# --- Multi-format: each source decoded once, one encoder process per output geometry ---
+def format_path(out_file, fmt):
+    # the 9x16 upload keeps the row's name, other formats get a suffix
+    return out_file if fmt == "9x16" else out_file.with_name(f"{out_file.stem}_{fmt}.mp4")
+
+def master_size(path, fmts):
+    # source aspect, downscaled only as far as the most demanding crop (and MASTER_MAX_MP) allows
+    sizes = [FORMATS[f] for f in fmts]
+    sw, sh = ffmpeg_parse_infos(path)["video_size"]
+    need = max(max(fw / min(sw, sh*fw/fh), fh / min(sh, sw*fh/fw)) for fw, fh in sizes)
+    s = min(1.0, need, math.sqrt(MASTER_MAX_MP * 1e6 / (sw*sh)))
+    return max(2, 2*round(sw*s/2)), max(2, 2*round(sh*s/2))
+
+class FormatEncoder:
+    # one output geometry: ffmpeg crops + scales master-size RGB from stdin, overlays its bar, encodes
+    def __init__(self, fmt, master, overlay, music, out_file, threads, encoder=None):
+        (fw, fh), (mw, mh) = FORMATS[fmt], master
+        video, audio = encoder_args(encoder, threads)
+        args = [*raw_input_args(mw, mh), "-i", overlay_png(overlay, 0.7, fw)]
+        maps = ["-map", "[v]"]
+        if music:
+            args += ["-i", str(music)]; maps += ["-map", "2:a", *audio]
+        graph = f"[0:v]{fit_vf(fw, fh)}[bg];[bg][1:v]overlay=0:0,format=yuv420p[v]"
+        self.proc = subprocess.Popen([ffmpeg_bin(), "-y", "-loglevel", "error", *args, "-filter_complex", graph,
+                                      *maps, "-t", str(TARGET_DURATION), *video, str(out_file)], stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self.proc.stdin.write(frame.data)
+
+    def close(self, ok=True):
+        # finish (or, after a failure, abandon) the encode; returns ffmpeg's exit code
+        if not ok: self.proc.kill()
+        try: self.proc.stdin.close()
+        except BrokenPipeError: pass
+        return self.proc.wait() if ok else 0
+
+def render_formats(kind, paths, overlay, music, outs, threads=RENDER_THREADS, encoder=None):
+    # outs: {format: path}; video decodes once at master_size(), photos run a Ken Burns per format
+    n = round(TARGET_DURATION*FPS)
+    per = max(1, (threads or auto_threads()) // len(outs))
+    if kind == "fallback":
+        for fmt, out in outs.items():
+            still_render(fallback_frame(overlay, *FORMATS[fmt]), music, out, per, encoder=encoder)
+        return {"frames": n*len(outs), "formats": len(outs), "static": True}
+    if kind == "video":
+        master = master_size(paths[0], outs)
+        shared = ScaledVideoClip(paths[0], TARGET_DURATION, *master)
+        clips, sizes = {fmt: shared for fmt in outs}, {fmt: master for fmt in outs}
+        stats = {"master": f"{master[0]}x{master[1]}"}
+    else:
+        photos = [decode_photo(p, [KenBurnsClip.buffer_size(*FORMATS[f]) for f in outs]) for p in paths]
+        clips = {fmt: KenBurnsClip(photos, TARGET_DURATION, *FORMATS[fmt]) for fmt in outs}
+        sizes, stats = {fmt: FORMATS[fmt] for fmt in outs}, {}
+        del photos  # the per-format buffers are all that is needed from here on
+    encs, ok, composite = {}, False, 0.0
+    try:
+        for fmt, out in outs.items(): encs[fmt] = FormatEncoder(fmt, sizes[fmt], overlay, music, out, per, encoder)
+        for i in range(n):
+            frames = {}  # one composite per distinct clip: video formats share theirs
+            for fmt, e in encs.items():
+                c = clips[fmt]
+                if id(c) not in frames:
+                    t0 = time.perf_counter()
+                    frames[id(c)] = np.ascontiguousarray(c.get_frame(i/FPS))  # pan views are strided
+                    composite += time.perf_counter() - t0
+                e.write(frames[id(c)])
+        ok = True
+    finally:
+        for c in {id(c): c for c in clips.values()}.values(): c.close()
+        failed = [fmt for fmt, e in encs.items() if e.close(ok)]
+    if failed: raise RuntimeError(f"ffmpeg failed on format(s) {', '.join(failed)}")
+    return {"frames": n*len(outs), "formats": len(outs), **stats, "composite_s": round(composite, 3)}
 
 # --- YouTube ---
 def yt_ready(): return all([YT_CLIENT_ID, YT_CLIENT_SECRET, YT_REFRESH_TOKEN])
 
-def yt_service():
-    creds = Credentials(
+def yt_credentials():
+    return Credentials(
         None,
         refresh_token=YT_REFRESH_TOKEN,
-        token_uri="https://oauth2.googleapis.com/token",
+        token_uri=YT_TOKEN_URI,
         client_id=YT_CLIENT_ID,
         client_secret=YT_CLIENT_SECRET,
         scopes=["https://www.googleapis.com/auth/youtube.upload"],
     )
+
+def yt_service(creds=None):
+    creds = creds or yt_credentials()
+    if YT_API_ROOT:
+        # media uploads go to the discovery doc's rootUrl, so re-root the bundled doc rather than api_endpoint
+        doc = json.loads(get_static_doc("youtube", "v3"))
+        doc["rootUrl"] = YT_API_ROOT.rstrip("/") + "/"
+        doc["baseUrl"] = doc["rootUrl"] + doc["servicePath"]
+        return build_from_document(doc, credentials=creds)
     return build("youtube","v3",credentials=creds)
 
-def yt_upload(path, title, desc, publish_at_rfc3339, tags=None):
-    yt = yt_service()
-    body = {
-        "snippet": {"title": title, "description": desc, "categoryId":"27", "tags": tags or []},
-        "status":  {"privacyStatus":"private", "publishAt": publish_at_rfc3339, "selfDeclaredMadeForKids": False}
-    }
-    media = MediaFileUpload(path, chunksize=-1, resumable=True, mimetype="video/mp4")
-    req = yt.videos().insert(part="snippet,status", body=body, media_body=media)
-    resp = None
-    while resp is None:
-        status, resp = req.next_chunk()
-        if status: print(f"Uploaded {int(status.progress()*100)}%")
-    return resp.get("id")
-
-def main():
+RETRY_STATUS = {500, 502, 503, 504}
+RETRY_ERRORS = (httplib2.HttpLib2Error, ConnectionError, TimeoutError, OSError)
+
+class UploadManager:
+    # one authorized client per run; an AuthorizedHttp per thread (httplib2 is not thread-safe)
+    QUOTA_PER_UPLOAD = 1600
+
+    def __init__(self, workers=YT_UPLOAD_WORKERS, chunk_mb=YT_CHUNK_MB, max_retries=YT_MAX_RETRIES, quota=YT_QUOTA_UNITS,
+                 quota_file=YT_QUOTA_FILE):
+        self.creds = yt_credentials()
+        self.creds.refresh(Request())  # fail fast on a bad refresh token, before anything renders
+        self.yt = yt_service(self.creds)
+        self.chunk = max(1, round(chunk_mb * 4)) * 256 * 1024
+        self.max_retries, self.quota, self.quota_file = max_retries, quota, Path(quota_file)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="yt-upload")
+        self.lock, self._local = threading.Lock(), threading.local()
+
+    def _http(self):
+        if not hasattr(self._local, "http"):
+            h = httplib2.Http(timeout=120)
+            h.redirect_codes = h.redirect_codes - {308}  # 308 is "resume incomplete" here, as in googleapiclient.build()
+            self._local.http = AuthorizedHttp(self.creds, http=h)
+        return self._local.http
+
+    def _spent_today(self):
+        # (Pacific day, units spent on it): YouTube's quota resets at midnight Pacific
+        day = now_pt().date().isoformat()
+        try: q = json.loads(self.quota_file.read_text())
+        except (OSError, ValueError): q = {}
+        return day, q.get("units", 0) if q.get("day") == day else 0
+
+    def _spend(self, day, units):
+        self.quota_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = part_file(self.quota_file)
+        tmp.write_text(json.dumps({"day": day, "units": units})); _publish(tmp, self.quota_file)
+
+    def reserve_quota(self):
+        with self.lock:
+            day, spent = self._spent_today()
+            if spent + self.QUOTA_PER_UPLOAD > self.quota: return False
+            self._spend(day, spent + self.QUOTA_PER_UPLOAD); return True
+
+    def submit(self, fn, *args):
+        return self.pool.submit(fn, *args)
+
+    def upload(self, path, title, desc, publish_at_rfc3339, tags=None, on_session=None):
+        # -> (video id, stats); on_session(uri) runs once YouTube has opened the resumable session
+        body = {
+            "snippet": {"title": title, "description": desc, "categoryId":"27", "tags": tags or []},
+            "status":  {"privacyStatus":"private", "publishAt": publish_at_rfc3339, "selfDeclaredMadeForKids": False}
+        }
+        media = MediaFileUpload(path, chunksize=self.chunk, resumable=True, mimetype="video/mp4")
+        req = self.yt.videos().insert(part="snippet,status", body=body, media_body=media)
+        return self._send(req, path, on_session)
+
+    def finish(self, uri, path):
+        # a crashed run's session: (id, stats) if complete or resumed, (None, {}) if expired or file gone
+        size = Path(path).stat().st_size if path and Path(path).is_file() else None
+        resp, content = self._http().request(uri, "PUT", headers={"Content-Length": "0",
+                                                                   "Content-Range": f"bytes */{size or '*'}"})
+        if resp.status in (200, 201): return json.loads(content).get("id"), {}
+        if resp.status in (404, 410) or (resp.status == 308 and size is None): return None, {}
+        if resp.status != 308: raise HttpError(resp, content, uri=uri)
+        media = MediaFileUpload(path, chunksize=self.chunk, resumable=True, mimetype="video/mp4")
+        req = self.yt.videos().insert(part="snippet,status", body={}, media_body=media)  # metadata went with the session
+        req.resumable_uri = uri
+        req.resumable_progress = int(resp["range"].rsplit("-", 1)[1]) + 1 if "range" in resp else 0
+        print(f"Resuming upload at {req.resumable_progress/1e6:.1f} of {size/1e6:.1f} MB  {Path(path).name}")
+        return self._send(req, path)
+
+    def _send(self, req, path, on_session=None):
+        http, resp, retries, streak, t0 = self._http(), None, 0, 0, time.perf_counter()
+        while resp is None:
+            try:
+                try: status, resp = req.next_chunk(http=http)
+                finally:
+                    if on_session and req.resumable_uri: on_session(req.resumable_uri); on_session = None
+                if status: print(f"Uploaded {int(status.progress()*100)}%  {Path(path).name}")
+                streak = 0; continue
+            except HttpError as e:
+                if e.resp.status == 403 and b"quotaExceeded" in (e.content or b""):
+                    with self.lock: self._spend(self._spent_today()[0], self.quota)  # nothing left today
+                if e.resp.status not in RETRY_STATUS: raise
+                err = e
+            except RETRY_ERRORS as e:
+                err = e
+            retries += 1; streak += 1
+            if streak > self.max_retries: raise err
+            delay = min(64, 2 ** streak) * random.uniform(0.5, 1.0)
+            print(f"Upload chunk failed ({err!r}); retry {streak}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+        secs, size = time.perf_counter() - t0, Path(path).stat().st_size
+        return resp.get("id"), {"bytes": size, "seconds": round(secs, 3), "retries": retries,
+                                "mb_per_s": round(size / 1e6 / max(secs, 1e-6), 2)}
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+# --- Per-row pipeline ---
+def row_key(r): return f"{r['PublishTime_Pacific']}|{r['Title']}"
+
+def row_meta(r):
+    title   = r.get("Title") or "Forex Voyage"
+    script  = r.get("Prompt_or_Script") or ""
+    hashtags = r.get("Hashtags","")
+    tags     = [t.strip('# ') for t in hashtags.split() if t.startswith('#')]
+    link     = r.get("ZenithFX_Link") or "https://zenithfx.com/"
+    desc = "\n".join([s for s in [
+        script.strip(),
+        "",
+        "Education only — not financial advice.",
+        "This video promotes my company, ZenithFX.",
+        "",
+        r.get("CTA","").strip(),
+        link,
+        hashtags
+    ] if s])
+    return title, desc, tags
+
+def out_path(r):
+    title = r.get("Title") or "Forex Voyage"
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in title)[:50]
+    return OUT_DIR / f"{safe}_{r['PublishTime_Pacific'].replace(' ','_').replace(':','-')}.mp4"
+
+def fetch_media(r):
+    # Pexels video -> photos -> builtin fallback; returns (kind, local paths)
+    keywords = (r.get("Broll_Keywords") or "forex charts;world map").split(";")
+    pick = pexels_video(keywords[0])
+    if pick:
+        print(f"Pexels pick: {pick['width']}x{pick['height']} @ {pick['fps']} fps, {pick['duration']} s, "
+              f"~{pick['mb']} MB (score {pick['score']}, page {pick['page']})")
+        vp = tmp_file("pv", ".mp4"); download(pick["link"], vp)
+        return "video", [str(vp)]
+    photos = []
+    for kw in keywords: photos += pexels_photos(kw, need=3)
+    photos = list(dict.fromkeys(photos))  # keywords often return the same photo; one download per URL
+    if photos:
+        ph = [tmp_file(f"ph_{i}", ".jpg") for i in range(len(photos[:6]))]
+        with ThreadPoolExecutor(max_workers=PHOTO_FETCH_THREADS, initializer=set_row, initargs=(row_key(r),)) as pool:
+            list(pool.map(download, photos[:6], ph))
+        return "photos", [str(p) for p in ph]
+    print("Pexels unavailable — using animated fallback for:", row_key(r))
+    return "fallback", []
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""): h.update(chunk)
+    return h.hexdigest()
+
+@functools.lru_cache(maxsize=1)
+def code_rev():
+    # any change to the templates or encoder code in this file invalidates old renders
+    return file_digest(__file__)[:16]
+
+def render_inputs(kind, paths, overlay, music, engine, encoder=None, segments=None):
+    # everything that determines the output bytes; its cache_key() is the manifest key
+    encoder = encoder or ENCODER_PROFILE
+    return {**({"segments": segments} if engine == "segments" else {}), "template": kind, "media": [file_digest(p) for p in paths], "overlay": overlay,
+            "music": Path(music).name if music else None,  # bed name encodes track, offset and shaping
+            "engine": engine, "encoder": {encoder: ENCODER_PROFILES[encoder]},
+            "size": [W, H], "fps": FPS, "duration": TARGET_DURATION,
+            "kb": [KB_ZOOM, KB_XFADE], "code": code_rev()}
+
+def pick_formats(formats=None):
+    # validated, with the 9x16 upload first (it is always rendered)
+    formats = formats or RENDER_FORMATS
+    bad = [f for f in formats if f not in FORMATS]
+    if bad: raise ValueError(f"unknown format(s) {bad}; choose from {sorted(FORMATS)}")
+    return ["9x16", *dict.fromkeys(f for f in formats if f != "9x16")]
+
+def render_row(r, media, threads=RENDER_THREADS, engine=RENDER_ENGINE, profile=RENDER_PROFILE, encoder=None,
+               workdir=None, formats=None):
+    # unless the manifest holds a render of the same inputs; returns the 9x16 path (runs in pool workers)
+    with tmp_scope(workdir or TMP_DIR):
+        return _render_row(r, media, threads, engine, profile, encoder, pick_formats(formats))
+
+def _render_row(r, media, threads, engine, profile, encoder, formats):
+    overlay = r.get("OverlayText") or r.get("Title") or "Forex Voyage"
+    kind, paths = media
+    out_file = out_path(r)
+    music = music_bed(pick_music(row_key(r)), seed=row_key(r))
+    encoder, engine = encoder or ENCODER_PROFILE, pick_engine(kind, engine)
+    inputs = render_inputs(kind, paths, overlay, music, engine, encoder, segment_count(threads))
+    multi = len(formats) > 1
+    if multi: engine = "fanout"  # render_formats() is its own engine; --engine does not apply
+    jobs = {}  # format -> (manifest key, inputs, path)
+    for fmt in formats:
+        inp = {**inputs, "engine": engine, "format": fmt, "size": list(FORMATS[fmt])} if multi else inputs
+        jobs[fmt] = (cache_key(inp), inp, format_path(out_file, fmt))
+    with RenderManifest() as manifest:
+        hits = {fmt: manifest.get(h) for fmt, (h, _, _) in jobs.items()}
+        if all(hits.values()):
+            with span("render", kind=kind, engine=engine, reused=True) as sp:
+                sp["bytes"] = sum(p.stat().st_size for p in hits.values())
+            print("Render reused:", ", ".join(str(p) for p in hits.values()))
+            return hits["9x16"]
+        with span("render", kind=kind, engine=engine, encoder=encoder, threads=threads, formats=len(formats)) as sp:
+            t0 = time.perf_counter()
+            parts = {fmt: p.with_name(p.stem + ".part.mp4") for fmt, (_, _, p) in jobs.items()}
+            if multi: job = lambda: render_formats(kind, paths, overlay, music, parts, threads, encoder)
+            else: job = lambda: render_media(kind, paths, overlay, music, parts["9x16"], threads, engine, encoder)
+            try:
+                stats = profiled(job, out_file.stem, profile)
+            except BaseException:
+                for part in parts.values(): part.unlink(missing_ok=True)
+                raise
+            for fmt, part in parts.items():
+                _publish(part, jobs[fmt][2])  # a crash mid-encode never leaves a plausible-looking MP4 behind
+            sp.update(stats or {}); sp["bytes"] = sum(p.stat().st_size for _, _, p in jobs.values())
+            # the rest is x264 encoding + muxing; segments' composite_s sums parallel slices, so no such split
+            if "composite_s" in sp and "segments" not in sp:
+                sp["encode_s"] = round(time.perf_counter() - t0 - sp["composite_s"], 3)
+        for h, inp, p in jobs.values(): manifest.put(h, p, row_key(r), inp)
+    print("Rendered:", ", ".join(str(p) for _, _, p in jobs.values()))
+    return out_file
+
+def _render_job(r, media, threads, engine, profile=RENDER_PROFILE, encoder=None, workdir=None, formats=None):
+    # Pool entry point: never raise across the process boundary, report (path, error) instead
+    set_row(row_key(r))
+    try:
+        return render_row(r, media, threads, engine, profile, encoder, workdir, formats), None
+    except Exception as e:
+        traceback.print_exc()
+        return None, repr(e)
+
+def publish_row(r, out_file, journal, uploads=None):
+    key = row_key(r); set_row(key)
+    title, desc, tags = row_meta(r)
+    # schedule (must be future & private per YouTube docs)
+    publish_dt_utc = parse_pt(r["PublishTime_Pacific"]).astimezone(pytz.utc)
+    if publish_dt_utc <= datetime.now(pytz.utc) + timedelta(minutes=2):
+        print("PublishAt too soon/past; upload skipped for:", key)
+    elif uploads:
+        if not uploads.reserve_quota():
+            print("YouTube quota budget for today (Pacific) used up; upload skipped for:", key); return
+        journal.started(key, out_file)
+        try:
+            with span("upload") as sp:
+                vid, stats = uploads.upload(str(out_file), title, desc, publish_dt_utc.isoformat(), tags=tags,
+                                            on_session=lambda uri: journal.session(key, uri))
+                sp.update(stats, video_id=vid)
+        except (HttpError, RefreshError, Exception) as e:
+            journal.failed(key)
+            print("YouTube upload error (skipped):", repr(e)); return
+        print(f"YouTube video id: {vid} ({stats['bytes']/1e6:.1f} MB at {stats['mb_per_s']} MB/s)")
+        journal.record(key, vid)
+        # posted: nothing will reuse it, so it leaves the cached renders/*.mp4 (renders/posted/ is evicted by quota)
+        with RenderManifest() as manifest: manifest.drop_row(key, POSTED_DIR)
+    else:
+        print("YouTube secrets missing/blank; skipped upload. (File saved in renders/.)")
+
+def resume_uploads(journal, uploads):
+    # before anything is picked: each interrupted upload ends posted (finished or resumed) or failed (re-render)
+    for key, e in journal.interrupted().items():
+        set_row(key)
+        try:
+            with span("upload", resumed=True) as sp:
+                vid, stats = uploads.finish(e["uri"], e.get("path"))
+                sp.update(stats, video_id=vid)
+        except (HttpError, RefreshError, Exception) as ex:
+            print("Interrupted upload still unsettled; the row waits for the next run:", key, repr(ex)); continue
+        if not vid:
+            print("Interrupted upload never completed; the row will be uploaded again:", key)
+            journal.failed(key); continue
+        print(f"Interrupted upload settled: {key} -> YouTube video id {vid}")
+        journal.record(key, vid)
+        with RenderManifest() as manifest: manifest.drop_row(key, POSTED_DIR)
+    set_row(None)
+
+_DONE = object()
+
+def _done_future(value):
+    f = Future(); f.set_result(value); return f
+
+def _publish_job(r, out_file, journal, uploads):
+    try:
+        publish_row(r, out_file, journal, uploads)
+    except Exception as e:
+        print("Row crashed (continuing):", r.get("Title"), repr(e))
+        traceback.print_exc()
+
+def run_pipeline(todo, journal, uploads, workers, threads, engine=RENDER_ENGINE, profile=RENDER_PROFILE,
+                 encoder=ENCODER_PROFILE, publish=True, formats=None):
+    # fetch -> render -> upload, neighbouring rows overlapping through bounded queues (publish=False: render only)
+    fetched  = queue.Queue(maxsize=PREFETCH_DEPTH)
+    rendered = queue.Queue(maxsize=max(1, workers))
+
+    def fetcher():
+        for r in todo:
+            set_row(row_key(r))
+            ws = Workspace(row_key(r))
+            try:
+                with span("fetch") as sp, ws.scope():
+                    item = (r, fetch_media(r), None, ws); sp["kind"] = item[1][0]
+            except Exception as e:
+                item = (r, None, repr(e), ws)
+            fetched.put(item)  # blocks once PREFETCH_DEPTH rows are waiting for the renderer
+        fetched.put(_DONE)
+
+    publishing = []
+    def uploader():
+        while (item := rendered.get()) is not _DONE:
+            r, fut, ws = item
+            set_row(row_key(r))
+            try: out_file, err = fut.result()
+            except Exception as e: out_file, err = None, repr(e)  # worker died (OOM, signal)
+            ws.close()  # media and intermediates are no longer needed once the MP4 exists (or failed)
+            if err:
+                print("Row crashed (continuing):", r.get("Title"), err); continue
+            if not publish: print("Pre-rendered:", out_file)
+            elif uploads: publishing.append(uploads.submit(_publish_job, r, out_file, journal, uploads))
+            else: _publish_job(r, out_file, journal, None)
+
+    t0, since = time.perf_counter(), round(time.time(), 3)
+    stages = [threading.Thread(target=fetcher, daemon=True), threading.Thread(target=uploader)]
+    for t in stages: t.start()
+    pool = process_pool(workers) if workers > 1 else None
+    try:
+        while (item := fetched.get()) is not _DONE:
+            r, media, err, ws = item
+            if err: fut = _done_future((None, err))
+            elif pool: fut = pool.submit(_render_job, r, media, threads, engine, profile, encoder, ws.dir, formats)
+            else: fut = _done_future(_render_job(r, media, threads, engine, profile, encoder, ws.dir, formats))
+            rendered.put((r, fut, ws))  # blocks while the upload side is `workers` rows behind
+    finally:
+        rendered.put(_DONE); stages[1].join()
+        if pool: pool.shutdown()
+        wait(publishing)
+    run_summary(time.perf_counter() - t0, since)
+
+def main(workers=RENDER_WORKERS, threads=RENDER_THREADS, engine=RENDER_ENGINE, profile=RENDER_PROFILE,
+         prerender_days=PRERENDER_DAYS, encoder=ENCODER_PROFILE, formats=None):
     ensure_dirs()
+    threads = threads or auto_threads(workers)
+    formats = pick_formats(formats)
     print("Secrets present -> PEXELS:", bool(PEXELS_API_KEY),
           "YT_ID:", bool(YT_CLIENT_ID), "YT_SECRET:", bool(YT_CLIENT_SECRET), "YT_REFRESH:", bool(YT_REFRESH_TOKEN))
 
     if not CSV_PATH.exists():
         print("prompts.csv not found in repo root."); return
+    reclaimed = sweep_workspaces() + enforce_disk_quota()
 
     state = load_state()
-    rows = list(csv.DictReader(CSV_PATH.open(encoding="utf-8", newline="")))
+    journal = StateJournal(state)  # replays postings a crashed run never pushed, before anything is picked
     print("Now (Pacific):", now_pt().strftime("%Y-%m-%d %H:%M"))
+    uploads = None
+    if yt_ready():
+        try: uploads = UploadManager()
+        except (RefreshError, Exception) as e: print("YouTube auth failed; uploads skipped this run:", repr(e))
+    if uploads: resume_uploads(journal, uploads)
 
-    # pick NEXT 10 future rows not posted
-    future = []
-    for r in rows:
-        try:
-            dt = parse_pt(r["PublishTime_Pacific"])
-        except Exception:
-            print("Bad date, skipping:", r.get("PublishTime_Pacific"), r.get("Title")); continue
-        key = f"{r['PublishTime_Pacific']}|{r['Title']}"
-        if key in state["posted"]: continue
-        if dt > now_pt(): future.append((dt, r))
-    future.sort(key=lambda x: x[0])
-    todo = [r for _, r in future[:10]]
-    print(f"Scheduling this run: {len(todo)} video(s).")
-    if not todo: return
-
-    for r in todo:
-        try:
-            key     = f"{r['PublishTime_Pacific']}|{r['Title']}"
-            title   = r.get("Title") or "Forex Voyage"
-            overlay = r.get("OverlayText") or title
-            script  = r.get("Prompt_or_Script") or ""
-            hashtags = r.get("Hashtags","")
-            tags     = [t.strip('# ') for t in hashtags.split() if t.startswith('#')]
-            link     = r.get("ZenithFX_Link") or "https://zenithfx.com/"
-            desc = "\n".join([s for s in [
-                script.strip(),
-                "",
-                "Education only — not financial advice.",
-                "This video promotes my company, ZenithFX.",
-                "",
-                r.get("CTA","").strip(),
-                link,
-                hashtags
-            ] if s])
-
-            # Media chain: Pexels video -> photos -> builtin fallback
-            keywords = (r.get("Broll_Keywords") or "forex charts;world map").split(";")
-            vurl = pexels_video(keywords[0])
-            final = None
-            if vurl:
-                vp = TMP_DIR / f"pv_{int(time.time())}.mp4"; download(vurl, vp)
-                final = build_from_video(str(vp), overlay)
-            else:
-                photos = []
-                for kw in keywords: photos += pexels_photos(kw, need=3)
-                if photos:
-                    ph = []
-                    for i,u in enumerate(photos[:6]):
-                        p = TMP_DIR / f"ph_{i}_{int(time.time())}.jpg"; download(u,p); ph.append(str(p))
-                    final = build_from_photos(ph, overlay)
-                else:
-                    print("Pexels unavailable — using animated fallback for:", key)
-                    final = build_fallback(overlay)
-
-            # audio
-            m = pick_music()
-            if m:
-                a = AudioFileClip(str(m)).fx(volumex, 0.18)
-                final = final.set_audio(a)
-
-            # export
-            safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in title)[:50]
-            out_file = OUT_DIR / f"{safe}_{r['PublishTime_Pacific'].replace(' ','_').replace(':','-')}.mp4"
-            final.write_videofile(str(out_file), fps=30, codec="libx264", audio_codec="aac", preset="medium", threads=4)
-            print("Rendered:", out_file)
-
-            # schedule (must be future & private per YouTube docs)
-            publish_dt_utc = parse_pt(r["PublishTime_Pacific"]).astimezone(pytz.utc)
-            if publish_dt_utc <= datetime.now(pytz.utc) + timedelta(minutes=2):
-                print("PublishAt too soon/past; upload skipped for:", key)
-            elif yt_ready():
-                try:
-                    vid = yt_upload(str(out_file), title, desc, publish_dt_utc.isoformat(), tags=tags)
-                    print("YouTube video id:", vid)
-                    state["posted"].append(key); save_and_commit_state(state, f"posted {key} -> {vid}")
-                except (HttpError, RefreshError, Exception) as e:
-                    print("YouTube upload error (skipped):", repr(e))
-            else:
-                print("YouTube secrets missing/blank; skipped upload. (File saved in renders/.)")
-
-        except Exception as e:
-            print("Row crashed (continuing):", r.get("Title"), repr(e))
-            traceback.print_exc()
-        finally:
-            try:
-                if 'final' in locals() and final: final.close()
-            except: pass
+    # pick NEXT 10 future rows not posted: a range query on the schedule index
+    with ScheduleIndex() as idx:
+        idx.sync(CSV_PATH, state["posted"] + list(journal.interrupted()))  # unsettled sessions stay unpicked
+        todo = idx.next_unposted(now_pt(), BATCH_SIZE)
+        batch = {row_key(r) for r in todo}
+        ahead = [r for r in idx.unposted_until(now_pt(), now_pt() + timedelta(days=prerender_days))
+                 if row_key(r) not in batch] if prerender_days > 0 else []
+    print(f"Scheduling this run: {len(todo)} video(s). Engine: {engine if len(formats) == 1 else 'fanout'}, "
+          f"encoder: {encoder}, formats: {', '.join(formats)} (9x16 is uploaded), "
+          f"workers: {workers} x {threads} ffmpeg threads ({usable_cpus()} usable CPUs).")
+    if not todo:
+        if uploads: uploads.close()
+        journal.flush(); return
+    try:
+        run_pipeline(todo, journal, uploads, workers, threads, engine, profile, encoder, formats=formats)
+    finally:
+        if uploads: uploads.close()
+        journal.flush()
+    if ahead:
+        print(f"Pre-rendering {len(ahead)} row(s) due within {prerender_days:g} day(s); uploads come in later runs.")
+        run_pipeline(ahead, journal, None, workers, threads, engine, profile, encoder, publish=False, formats=formats)
+    with RenderManifest() as manifest: reclaimed += manifest.prune()
+    reclaimed += enforce_disk_quota() + Workspace.reclaimed
+    print(f"Disk: reclaimed {reclaimed/1e6:.1f} MB this run; tmp/ + renders/ now hold "
+          f"{disk_usage(TMP_DIR, OUT_DIR)/1e6:.1f} MB (quota {DISK_QUOTA_MB:g} MB)")
+    cache_evict()
+
+# --- Serve: one resident process instead of an hourly cold start ---
+class Server:
+    # warm state between wakes; wake() renders the rows due within lead_min and returns seconds to sleep
+    def __init__(self, workers=RENDER_WORKERS, threads=RENDER_THREADS, engine=RENDER_ENGINE, profile=RENDER_PROFILE,
+                 encoder=ENCODER_PROFILE, formats=None, lead_min=SERVE_LEAD_MIN):
+        with span("startup", import_s=round(IMPORT_S, 3)) as sp:
+            ensure_dirs(); ffmpeg_bin()
+            self.workers, self.threads = workers, threads or auto_threads(workers)
+            self.engine, self.profile, self.encoder = engine, profile, encoder
+            self.formats, self.lead = pick_formats(formats), timedelta(minutes=lead_min)
+            self.reclaimed = sweep_workspaces() + enforce_disk_quota()
+            self.state = load_state()
+            self.journal = StateJournal(self.state)
+            self.idx = ScheduleIndex(":memory:")  # rebuilt from the CSV at start; only re-parsed when it changes
+            self.uploads = None
+            if yt_ready():
+                try: self.uploads = UploadManager()
+                except (RefreshError, Exception) as e: print("YouTube auth failed; uploads skipped:", repr(e))
+            if self.uploads: resume_uploads(self.journal, self.uploads)
+            sp["uploads"] = bool(self.uploads)
+        self.ready_s = IMPORT_S + sp["duration_s"]
+        print(f"Serving: warm in {self.ready_s:.2f}s (imports {IMPORT_S:.2f}s). Lead {lead_min:g} min, "
+              f"formats {', '.join(self.formats)}, {self.workers} x {self.threads} ffmpeg threads.")
+
+    def due(self, now):
+        # rows due within the lead that YouTube can still schedule and that are not held after a failure
+        return self.idx.unposted_until(now + timedelta(minutes=2), now + self.lead, ready=time.time())[:BATCH_SIZE]
+
+    def wake(self):
+        if not CSV_PATH.exists():
+            print("prompts.csv not found; waiting."); return SERVE_MAX_SLEEP_MIN*60
+        set_row(None); now = now_pt()
+        self.idx.sync(CSV_PATH, self.state["posted"] + list(self.journal.interrupted()))
+        todo = self.due(now)
+        if todo:
+            with span("wake", rows=len(todo)) as sp:
+                run_pipeline(todo, self.journal, self.uploads, self.workers, self.threads, self.engine,
+                             self.profile, self.encoder, formats=self.formats)
+                self.journal.flush(); set_row(None)
+            # rows still unposted after this (failed, skipped) wait SERVE_RETRY_MIN; posted ones leave via sync
+            self.idx.hold([row_key(r) for r in todo], time.time() + SERVE_RETRY_MIN*60)
+            print(f"Wake: {len(todo)} row(s) in {sp['duration_s']:.1f}s ({sp['duration_s']/len(todo):.1f}s per video).")
+            with RenderManifest() as manifest: self.reclaimed += manifest.prune()
+            self.reclaimed += enforce_disk_quota(); cache_evict()
+            self.idx.sync(CSV_PATH, self.state["posted"] + list(self.journal.interrupted()))
+            now = now_pt()
+            if self.due(now): return 0  # more came due while rendering
+        after = now + timedelta(minutes=2)
+        nxt = next(iter(self.idx.next_unposted(after, 1, ready=time.time())), None)
+        retry = self.idx.next_retry(after)
+        sleep = SERVE_MAX_SLEEP_MIN*60
+        if retry: sleep = min(sleep, retry - time.time())
+        if nxt:
+            sleep = min(sleep, max(0, (parse_pt(nxt["PublishTime_Pacific"]) - self.lead - now).total_seconds()))
+            print(f"Next: {row_key(nxt)}; waking in {sleep/60:.1f} min.")
+        else: print(f"Nothing scheduled; re-reading {CSV_PATH} in {sleep/60:.0f} min.")
+        return max(sleep, 1)
+
+    def close(self):
+        if self.uploads: self.uploads.close()
+        self.journal.flush(); self.idx.db.close()
+
+def serve(workers=RENDER_WORKERS, threads=RENDER_THREADS, engine=RENDER_ENGINE, profile=RENDER_PROFILE,
+          encoder=ENCODER_PROFILE, formats=None, lead_min=SERVE_LEAD_MIN):
+    # sleep until the next row's PublishTime minus lead_min; SIGTERM/SIGINT finish the wake, then exit
+    stop = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT): signal.signal(sig, lambda *_: stop.set())
+    server = Server(workers, threads, engine, profile, encoder, formats, lead_min)
+    try:
+        while not stop.is_set():
+            try: sleep = server.wake()
+            except Exception as e:
+                print("Wake crashed (continuing):", repr(e)); traceback.print_exc(); sleep = 60
+            stop.wait(sleep)
+    finally:
+        server.close()
+        print(f"Serve stopped; reclaimed {server.reclaimed/1e6:.1f} MB of disk while up.")
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Render and schedule the next batch of Shorts.")
+    ap.add_argument("mode", nargs="?", choices=["run", "serve"], default="run",
+                    help="run: one batch and exit (cron); serve: stay resident and render just in time")
+    ap.add_argument("--workers", type=int, default=RENDER_WORKERS, help="parallel render processes (env RENDER_WORKERS)")
+    ap.add_argument("--threads", type=int, default=RENDER_THREADS,
+                    help="ffmpeg threads per render, 0 = usable cores / workers (env RENDER_THREADS)")
+    ap.add_argument("--engine", choices=["moviepy", "ffmpeg", "segments"], default=RENDER_ENGINE,
+                    help="render backend (env RENDER_ENGINE)")
+    ap.add_argument("--segments", type=int, default=RENDER_SEGMENTS,
+                    help="segments engine: parallel slices per video, 0 = one per ffmpeg thread (env RENDER_SEGMENTS)")
+    ap.add_argument("--encoder", choices=sorted(ENCODER_PROFILES), default=ENCODER_PROFILE,
+                    help="x264/AAC encoder profile (env ENCODER_PROFILE)")
+    ap.add_argument("--profile", choices=["cprofile", "pyinstrument"], default=RENDER_PROFILE or None,
+                    help="profile each render into renders/profiles/ (env RENDER_PROFILE)")
+    ap.add_argument("--prerender-days", type=float, default=PRERENDER_DAYS,
+                    help="after the batch, render (not upload) rows due within N days (env PRERENDER_DAYS)")
+    ap.add_argument("--lead-min", type=float, default=SERVE_LEAD_MIN,
+                    help="serve: render + upload this many minutes before PublishTime (env SERVE_LEAD_MIN)")
+    ap.add_argument("--formats", nargs="+", choices=sorted(FORMATS), default=RENDER_FORMATS,
+                    help="output geometries per row, decoded once and encoded per format; 9x16 is always "
+                         "rendered and is the one uploaded (env RENDER_FORMATS, comma-separated)")
+    args = ap.parse_args()
+    RENDER_SEGMENTS = args.segments  # read at render time; process_pool() hands it to workers
     ensure_dirs()
     try:
-        main()
+        if args.mode == "serve":
+            serve(args.workers, args.threads, args.engine, args.profile, args.encoder, args.formats, args.lead_min)
+        else:
+            main(args.workers, args.threads, args.engine, args.profile, args.prerender_days, args.encoder, args.formats)
     except Exception as e:
         print("FATAL (but not failing job):", repr(e))